@@ -4,14 +4,10 @@ import sys
 import getopt
 import time
 import locale
+from functools import cached_property
 
 from .constants import __version__
-from .platform import ui_available, display_server, Gtk, Gdk
-from .screenshot import ScreenshotCapture
-from .ocr import OCRProcessor
-from .color import ColorDetector
-from .macro import MacroManager
-from .gui import MainWindow
+from . import platform
 
 
 class OCRDesktopApp:
@@ -41,12 +37,7 @@ class OCRDesktopApp:
         # Color detection
         self._color_enabled = False
         self._color_max = 3
-
-        # Components
-        self._screenshot = ScreenshotCapture(debug=debug)
-        self._ocr = OCRProcessor(language=self._language, scale_factor=self._scale_factor, debug=debug)
-        self._color = ColorDetector(max_colors=self._color_max, debug=debug)
-        self._macro = MacroManager(debug=debug)
+        self._color_min_confidence = 10  # Skip color analysis for lower confidence words
 
         # Results
         self._ocr_text = ''
@@ -56,6 +47,31 @@ class OCRDesktopApp:
         # Set locale for tesseract
         locale.setlocale(locale.LC_ALL, 'C')
 
+    # Components, each module is only imported once its component is needed
+    @cached_property
+    def _screenshot(self):
+        """Screenshot capture."""
+        from .screenshot import ScreenshotCapture
+        return ScreenshotCapture(debug=self._debug)
+
+    @cached_property
+    def _ocr(self):
+        """OCR processor."""
+        from .ocr import OCRProcessor
+        return OCRProcessor(language=self._language, scale_factor=self._scale_factor, debug=self._debug)
+
+    @cached_property
+    def _macro(self):
+        """Macro manager."""
+        from .macro import MacroManager
+        return MacroManager(debug=self._debug)
+
+    @cached_property
+    def _color(self):
+        """Color detector, only created once color detection is needed."""
+        from .color import ColorDetector
+        return ColorDetector(max_colors=self._color_max, debug=self._debug)
+
     def run(self):
         """Run the application."""
         self._parse_command_line()
@@ -64,29 +80,39 @@ class OCRDesktopApp:
             return
 
         # Handle macros for window/desktop mode
-        if self._screenshot_mode in [0, 1]:
+        macro_loaded = self._screenshot_mode in [0, 1] and self._macro.macro_exists()
+        if macro_loaded:
             if not self._hide_gui:
                 self._macro.show_gui()
             else:
-                if self._macro.macro_exists():
-                    self._macro.run_macro()
+                self._macro.run_macro()
 
         if self._debug:
             print("PreWaitForFinish")
 
-        if self._screenshot_mode in [0, 1]:
+        # Only wait when a macro could still be changing the screen
+        if macro_loaded:
             self._macro.wait_for_finish()
-            time.sleep(0.5)
+            time.sleep(0.5)  # Let the last macro step and the manager window settle
 
-        # Take screenshot
-        time.sleep(0.3)  # Brief delay before capture
-        if self._screenshot.capture(self._screenshot_mode, self._file_path):
-            self._run_ocr()
+        # Without the GUI there is no Retry OCR, so a grayscale run never needs
+        # the colors of the loaded file
+        draft_mode = None
+        if self._grayscale and self._hide_gui and not self._color_enabled:
+            draft_mode = 'L'
 
-            if not self._hide_gui:
-                self._show_gui()
-            else:
-                self._output_results()
+        # Take screenshot
+        if self._screenshot.capture(self._screenshot_mode, self._file_path, draft_mode):
+            try:
+                self._run_ocr()
+
+                if not self._hide_gui:
+                    self._show_gui()
+                else:
+                    self._output_results()
+            finally:
+                # Shut a persistent Tesseract engine down while the interpreter is intact
+                self._ocr.close()
 
     def _run_ocr(self):
         """Run OCR processing on captured images."""
@@ -98,19 +124,28 @@ class OCRDesktopApp:
         self._ocr.language = self._language
 
         # Update color detector
-        self._color.enabled = self._color_enabled
-        self._color.max_colors = self._color_max
+        color_callback = None
+        if self._color_enabled:
+            self._color.enabled = True
+            self._color.max_colors = self._color_max
+            color_callback = self._get_color_string
 
         # Run OCR
-        color_callback = self._color.get_color_string if self._color_enabled else None
         self._ocr_text, self._word_list, self._modified_images = self._ocr.process_images(
             self._screenshot.images,
             offset_x=self._screenshot.offset_x,
             offset_y=self._screenshot.offset_y,
             color_callback=color_callback,
-            include_word_list=not self._hide_gui
+            include_word_list=not self._hide_gui,
+            include_modified_images=False
         )
 
+    def _get_color_string(self, box, index, img):
+        """Color callback for OCR that skips words OCR is not confident about."""
+        if float(box['conf'][index]) < self._color_min_confidence:
+            return 'unknown'
+        return self._color.get_color_string(box, index, img)
+
     def _output_results(self):
         """Output OCR results to clipboard/stdout."""
         if self._send_to_clipboard:
@@ -120,7 +155,7 @@ class OCRDesktopApp:
 
     def _set_text_to_clipboard(self, text):
         """Set text to system clipboard."""
-        if not ui_available:
+        if not platform.ui_available:
             if self._debug:
                 print('GTK / GDK / GI is not available')
             return
@@ -129,6 +164,7 @@ class OCRDesktopApp:
             print("----_setTextToClipboard Start--")
             print(text)
             print("----_setTextToClipboard End----")
+        from .platform import Gtk, Gdk
         try:
             clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             clipboard.set_text(text, -1)
@@ -138,6 +174,7 @@ class OCRDesktopApp:
 
     def _show_gui(self):
         """Show the main GUI window."""
+        from .gui import MainWindow
         window = MainWindow(
             ocr_text=self._ocr_text,
             word_list=self._word_list,
@@ -161,7 +198,7 @@ class OCRDesktopApp:
     def _parse_command_line(self):
         """Parse command line arguments."""
         # Set hideGui if GTK is not available
-        if not ui_available:
+        if not platform.ui_available:
             if self._debug:
                 print('GTK / GDK / GI is not available')
             self._hide_gui = True
@@ -170,52 +207,94 @@ class OCRDesktopApp:
             opts, args = getopt.getopt(sys.argv[1:], "hl:vndocCOx:gibt:m:f:")
 
             for opt, arg in opts:
-                if opt == '-v':
-                    self._debug = True
-                    self._screenshot._debug = True
-                    self._ocr._debug = True
-                    self._color._debug = True
-                    self._macro._debug = True
-                    print('Debugmode ON')
-                elif opt == '-f':
-                    self._screenshot_mode = 3
-                    self._file_path = arg
-                elif opt == '-C':
-                    if ui_available:
-                        self._screenshot_mode = 2
-                elif opt == '-d':
-                    if ui_available:
-                        self._screenshot_mode = 1
-                elif opt == '-g':
-                    self._grayscale = True
-                elif opt == '-i':
-                    self._invert = True
-                elif opt == '-b':
-                    self._grayscale = True
-                    self._black_white = True
-                elif opt == '-t':
-                    self._black_white_value = int(arg)
-                elif opt == '-c':
-                    if ui_available:
-                        self._send_to_clipboard = True
-                elif opt == '-l':
-                    self._language = arg
-                elif opt == '-m':
-                    if ui_available:
-                        self._macro.load_macro_file(arg)
-                elif opt == '-n':
-                    self._hide_gui = True
-                elif opt == '-o':
-                    self._print_to_stdout = True
-                elif opt == '-O':
-                    self._color_enabled = True
-                elif opt == '-x':
-                    self._color_max = int(arg)
-                elif opt == '-h':
-                    self._print_help()
+                self._OPTION_HANDLERS[opt](self, arg)
         except Exception:
             self._print_help()
 
+    def _enable_debug(self):
+        """Enable debug output for the application and all components."""
+        self._debug = True
+        # Components created later pick up the flag from the application
+        for name in ('_screenshot', '_ocr', '_macro', '_color'):
+            component = self.__dict__.get(name)
+            if component is not None:
+                component._debug = True
+        print('Debugmode ON')
+
+    # Command line option handlers, each takes the option argument
+    def _opt_debug(self, arg):
+        self._enable_debug()
+
+    def _opt_file(self, arg):
+        self._screenshot_mode = 3
+        self._file_path = arg
+
+    def _opt_clipboard_image(self, arg):
+        if platform.ui_available:
+            self._screenshot_mode = 2
+
+    def _opt_desktop(self, arg):
+        if platform.ui_available:
+            self._screenshot_mode = 1
+
+    def _opt_grayscale(self, arg):
+        self._grayscale = True
+
+    def _opt_invert(self, arg):
+        self._invert = True
+
+    def _opt_black_white(self, arg):
+        self._grayscale = True
+        self._black_white = True
+
+    def _opt_black_white_value(self, arg):
+        self._black_white_value = int(arg)
+
+    def _opt_send_to_clipboard(self, arg):
+        if platform.ui_available:
+            self._send_to_clipboard = True
+
+    def _opt_language(self, arg):
+        self._language = arg
+
+    def _opt_macro(self, arg):
+        if platform.ui_available:
+            self._macro.load_macro_file(arg)
+
+    def _opt_hide_gui(self, arg):
+        self._hide_gui = True
+
+    def _opt_stdout(self, arg):
+        self._print_to_stdout = True
+
+    def _opt_color(self, arg):
+        self._color_enabled = True
+
+    def _opt_color_max(self, arg):
+        self._color_max = int(arg)
+
+    def _opt_help(self, arg):
+        self._print_help()
+
+    _OPTION_HANDLERS = {
+        '-v': _opt_debug,
+        '-f': _opt_file,
+        '-C': _opt_clipboard_image,
+        '-d': _opt_desktop,
+        '-g': _opt_grayscale,
+        '-i': _opt_invert,
+        '-b': _opt_black_white,
+        '-t': _opt_black_white_value,
+        '-c': _opt_send_to_clipboard,
+        '-l': _opt_language,
+        '-m': _opt_macro,
+        '-n': _opt_hide_gui,
+        '-o': _opt_stdout,
+        '-O': _opt_color,
+        '-x': _opt_color_max,
+        '-h': _opt_help,
+    }
+
     def _print_help(self):
         """Print help message."""
         print(f'Version {__version__}')
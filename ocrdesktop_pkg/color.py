@@ -1,8 +1,156 @@
 """Color detection functionality for OCRdesktop."""
 
-from collections import defaultdict
+import functools
 
-from .platform import scipy_available, webcolors_available, KDTree, CSS3_HEX_TO_NAMES, hex_to_rgb
+from .platform import (
+    numpy_available, numba_available, webcolors_available,
+    np, njit, CSS3_HEX_TO_NAMES, hex_to_rgb
+)
+
+# Rows per distance tile, keeps the N x M distance matrix cache sized
+_TILE_ROWS = 1024
+
+# Boxes smaller than this are too small for a meaningful color description
+_MIN_BOX_PIXELS = 16
+
+# Bits per color channel of the buckets colors are merged into. Antialiased
+# glyph edges produce many near-identical colors that all map to the same
+# CSS name. Each bucket is named after its most common real color.
+_CHANNEL_BITS = 5
+_CHANNEL_SHIFT = 8 - _CHANNEL_BITS
+
+
+@functools.lru_cache(maxsize=1)
+def _css_color_db():
+    """Build the CSS color lookup tables once per process.
+
+    Returns:
+        tuple: (color names tuple, N x 3 uint8 RGB array,
+            dict of packed 0xRRGGBB value to color index)
+    """
+    color_names = tuple(CSS3_HEX_TO_NAMES.values())
+    rgb_values = np.array([hex_to_rgb(color_hex) for color_hex in CSS3_HEX_TO_NAMES], dtype=np.uint8)
+    exact_indices = {int(color_hex[1:], 16): i for i, color_hex in enumerate(CSS3_HEX_TO_NAMES)}
+    return color_names, rgb_values, exact_indices
+
+
+def _bucket_colors(colors, counts):
+    """Merge the colors of a box that fall into the same bucket.
+
+    Args:
+        colors: N x 3 uint8 array of unique RGB values
+        counts: Pixel count for each row of colors
+
+    Returns:
+        tuple: (bucket keys, most common real color of each bucket, pixel count of each bucket)
+    """
+    buckets = colors.astype(np.uint32) >> _CHANNEL_SHIFT
+    keys = (buckets[:, 0] << (2 * _CHANNEL_BITS)) | (buckets[:, 1] << _CHANNEL_BITS) | buckets[:, 2]
+    # Sorted by bucket, the most common color first within each
+    order = np.lexsort((-counts, keys))
+    keys = keys[order]
+    first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[first], colors[order[first]], np.add.reduceat(counts[order], first)
+
+
+@functools.lru_cache(maxsize=1)
+def _nearest_color_table():
+    """Create the table of nearest CSS color indices once per process.
+
+    It holds an entry for every color bucket, -1 where not computed yet.
+    It is built on first use and reused by every later box and OCR run.
+
+    Returns:
+        numpy.ndarray: int16 table indexed by the packed truncated color
+    """
+    return np.full(1 << (3 * _CHANNEL_BITS), -1, dtype=np.int16)
+
+
+def _nearest_color_indices(colors, css_rgb):
+    """Find the nearest CSS color for each RGB color by brute force.
+
+    With only ~150 CSS colors, comparing against all of them at once is
+    cheaper than a tree lookup. The squared distance |p - c|^2 is expanded
+    to |p|^2 + |c|^2 - 2 p.c so the bulk of the work is a single float32
+    matrix product. |p|^2 is the same for every CSS color and cannot change
+    the argmin, so it is left out.
+
+    Args:
+        colors: N x 3 uint8 array of RGB values
+        css_rgb: M x 3 uint8 array of CSS color values
+
+    Returns:
+        numpy.ndarray: Index of the nearest CSS color for each row of colors
+    """
+    css = css_rgb.astype(np.float32)
+    css_sq = (css * css).sum(1)
+    css_t2 = 2 * css.T
+    indices = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), _TILE_ROWS):
+        pixels = colors[start:start + _TILE_ROWS].astype(np.float32)
+        indices[start:start + _TILE_ROWS] = (css_sq - pixels @ css_t2).argmin(1)
+    return indices
+
+
+def _cached_nearest_color_indices(keys, colors, css_rgb, exact_indices):
+    """Find the nearest CSS color for each bucket, reusing earlier results.
+
+    A bucket keeps the name found for the first color it was looked up
+    with, colors that are exactly a CSS color always get that color's name.
+
+    Args:
+        keys: Bucket key of each color, from _bucket_colors
+        colors: N x 3 uint8 array of the real color of each bucket
+        css_rgb: M x 3 uint8 array of CSS color values
+        exact_indices: Dict of packed 0xRRGGBB value to CSS color index
+
+    Returns:
+        numpy.ndarray: Index of the nearest CSS color for each row of colors
+    """
+    table = _nearest_color_table()
+    indices = table[keys].astype(np.intp)
+    missing = indices < 0
+    if missing.any():
+        indices[missing] = _nearest_color_indices(colors[missing], css_rgb)
+        table[keys[missing]] = indices[missing]
+
+    packed = (colors[:, 0].astype(np.uint32) << 16) | (colors[:, 1].astype(np.uint32) << 8) | colors[:, 2]
+    for row, value in enumerate(packed.tolist()):
+        exact = exact_indices.get(value)
+        if exact is not None:
+            indices[row] = exact
+    return indices
+
+
+if numba_available:
+    @njit(cache=True, nogil=True)
+    def _nearest_color_totals(colors, counts, css_rgb):
+        """Sum pixel counts per nearest CSS color (compiled with numba).
+
+        Args:
+            colors: N x 3 uint8 array of unique RGB values
+            counts: Pixel count for each row of colors
+            css_rgb: M x 3 uint8 array of CSS color values
+
+        Returns:
+            numpy.ndarray: Pixel total for each CSS color
+        """
+        totals = np.zeros(css_rgb.shape[0], dtype=np.int64)
+        for i in range(colors.shape[0]):
+            best_index = 0
+            best_distance = 1 << 30
+            for j in range(css_rgb.shape[0]):
+                distance = 0
+                for c in range(3):
+                    diff = np.int32(colors[i, c]) - np.int32(css_rgb[j, c])
+                    distance += diff * diff
+                if distance < best_distance:
+                    best_distance = distance
+                    best_index = j
+            totals[best_index] += counts[i]
+        return totals
+else:
+    _nearest_color_totals = None
 
 
 class ColorDetector:
@@ -12,9 +160,6 @@ class ColorDetector:
         self._max_colors = max_colors
         self._debug = debug
         self._enabled = False
-        self._kdt_db = None
-        self._color_names = []
-        self._color_cache = {}
 
     @property
     def enabled(self):
@@ -46,9 +191,9 @@ class ColorDetector:
         if not self._enabled:
             return 'unknown'
 
-        if not scipy_available:
+        if not numpy_available:
             if self._debug:
-                print('getColorString scipy not available')
+                print('getColorString numpy not available')
             return 'unknown'
 
         if not webcolors_available:
@@ -67,32 +212,43 @@ class ColorDetector:
             height = box['height'][index]
             left = box['left'][index]
             top = box['top'][index]
+            if width * height < _MIN_BOX_PIXELS:
+                return 'unknown'
 
             box_img = img.crop((left, top, left + width, top + height))
+            if box_img.mode != 'RGB':
+                box_img = box_img.convert('RGB')
 
-            # Count colors
-            by_color = defaultdict(int)
-            for pixel in box_img.getdata():
-                by_color[pixel] += 1
+            # Count colors, a box can never hold more colors than pixels
+            color_counts = box_img.getcolors(maxcolors=box_img.width * box_img.height)
+            if not color_counts:
+                return 'unknown'
+            counts, colors = zip(*color_counts)
+            keys, colors, counts = _bucket_colors(np.array(colors, dtype=np.uint8),
+                                                  np.array(counts, dtype=np.int64))
 
-            # Convert to color names and count
-            by_color_name = defaultdict(int)
-            for color, count in by_color.items():
-                by_color_name[self._rgb_to_name(color)] += count
+            # Sum pixel counts per color name
+            color_names, css_rgb, exact_indices = _css_color_db()
+            if _nearest_color_totals is not None:
+                totals = _nearest_color_totals(colors, counts, css_rgb)
+            else:
+                indices = _cached_nearest_color_indices(keys, colors, css_rgb, exact_indices)
+                totals = np.bincount(indices, weights=counts, minlength=len(color_names))
 
-            # Get top colors
-            color_list = [k for k, v in sorted(by_color_name.items(), key=lambda item: item[1], reverse=True)]
+            # Get top colors, only sorting the selected ones
+            top_count = min(self._max_colors, len(totals))
+            top = np.argpartition(-totals, top_count - 1)[:top_count]
+            top = top[np.argsort(-totals[top], kind='stable')]
 
             color_str = ''
-            for i in range(min(self._max_colors, len(color_list))):
-                color_name = color_list[i]
-                count = by_color_name[color_name]
-                if width * height != 0:
-                    percent = int(round(count / (width * height) * 100, 0))
-                    if percent > 0:
-                        color_str += f'{color_name}: {percent} %, '
-                else:
-                    color_str += f'{color_name}: {count} pixel, '
+            for color_index in top.tolist():
+                count = int(totals[color_index])
+                if count == 0:
+                    break
+                color_name = color_names[color_index]
+                percent = int(round(count / (width * height) * 100, 0))
+                if percent > 0:
+                    color_str += f'{color_name}: {percent} %, '
 
             return color_str[:-2] if color_str else 'unknown'
 
@@ -100,31 +256,3 @@ class ColorDetector:
             if self._debug:
                 print(f"Color detection error: {e}")
             return 'unknown'
-
-    def _rgb_to_name(self, rgb_tuple):
-        """Convert RGB tuple to nearest CSS color name.
-
-        Args:
-            rgb_tuple: (R, G, B) tuple
-
-        Returns:
-            str: CSS color name
-        """
-        # Check cache first
-        if rgb_tuple in self._color_cache:
-            return self._color_cache[rgb_tuple]
-
-        # Build KDTree if not already done
-        if self._kdt_db is None:
-            css_db = CSS3_HEX_TO_NAMES
-            rgb_values = []
-            for color_hex, color_name in css_db.items():
-                self._color_names.append(color_name)
-                rgb_values.append(hex_to_rgb(color_hex))
-            self._kdt_db = KDTree(rgb_values)
-
-        # Find nearest color
-        distance, index = self._kdt_db.query(rgb_tuple)
-        result = self._color_names[index]
-        self._color_cache[rgb_tuple] = result
-        return result
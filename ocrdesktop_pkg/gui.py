@@ -1,15 +1,59 @@
 """GUI components for OCRdesktop."""
 
+import queue
+import threading
 import time
-import _thread
 
 from .constants import __version__, __appname__, __authors__, __website__, __copyright__, __license__, __comments__
-from .platform import ui_available, display_server, Gtk, Gdk, GObject, pyatspi
+# This module is only imported once the window is shown, so GTK is needed
+# by then. numpy and pyatspi are imported where they are used.
+from . import platform
+from .platform import display_server, Gtk, Gdk, GObject, GLib
+
+# Default shortcut for every menu accelerator path
+_ACCEL_PATHS = {
+    "<OCRdesktop>/Toggle View": "<Alt>v",
+    "<OCRdesktop>/Retry OCR": "F5",
+    "<OCRdesktop>/Send to Clipboard": "<Control>b",
+    "<OCRdesktop>/Close": "<Control>q",
+    "<OCRdesktop>/Preclick": "<Control>p",
+    "<OCRdesktop>/Left Click": "<Control>l",
+    "<OCRdesktop>/Double Click": "<Control>d",
+    "<OCRdesktop>/Right Click": "<Control>r",
+    "<OCRdesktop>/Middle Click": "<Control>m",
+    "<OCRdesktop>/Route To": "<Control>t",
+    "<OCRdesktop>/Send Key": "<Control>k",
+    "<OCRdesktop>/Macro/Save As": "<Control>s",
+    "<OCRdesktop>/Macro/Load": "<Control>o",
+    "<OCRdesktop>/Macro/Unload": "<Control>u",
+    "<OCRdesktop>/Macro/Run": "<Control>n",
+}
+_accels_registered = False
+
+# Number of words added to the tree model per idle callback
+_POPULATE_CHUNK_SIZE = 500
+
+
+def _register_accels():
+    """Add the default shortcuts to the accelerator map once per process."""
+    global _accels_registered
+    if _accels_registered:
+        return
+    for path, accelerator in _ACCEL_PATHS.items():
+        key, mod = Gtk.accelerator_parse(accelerator)
+        Gtk.AccelMap.add_entry(path, key, mod)
+    _accels_registered = True
 
 
 class MainWindow(Gtk.Window):
     """Main OCRdesktop window for displaying OCR results."""
 
+    # Tree model columns, the first one is hidden
+    _COL_TYPES = (GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_INT,
+                  GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_INT,
+                  GObject.TYPE_INT, GObject.TYPE_INT)
+    _HEADERS = ('OCR Text', 'Fontsize', 'Color', 'Object', 'X Position', 'Y Position', 'Confidence')
+
     def __init__(self, ocr_text='', word_list=None, scale_factor=3, offset_x=0, offset_y=0,
                  screenshot_mode=0, macro_manager=None, debug=False):
         self._debug = debug
@@ -23,19 +67,28 @@ class MainWindow(Gtk.Window):
         self._display_server = display_server
 
         self._tree = None
+        self._tree_populated = False
+        self._populate_iter = None
+        self._pending_cursor = None
+        self._coord_cache = []
         self._textbox = None
         self._textbuffer = None
+        self._line_word_offsets = None
         self._scrolled_window_tree = None
         self._scrolled_window_text = None
+        self._stack = None
         self._keyboard_overlay_label = None
         self._keyboard_overlay_active = False
-        self._grid = None
+        self._atspi = None
+        self._key_pressed_event = None
+        self._key_released_event = None
+        self._vbox = None
         self._menubar = None
         self._font_button = None
         self._accelerators = None
         self._view_mode = 0
         self._save_to_macro = False
-        self._gtk_main_running = False
+        self._loop = GLib.MainLoop()
 
         # Image processing options (for retry)
         self._grayscale = False
@@ -45,6 +98,10 @@ class MainWindow(Gtk.Window):
         # Callbacks for refresh
         self._on_refresh_callback = None
 
+        # Worker thread for clicks and macro runs, started on first use
+        self._action_queue = queue.Queue()
+        self._action_worker = None
+
     def set_refresh_callback(self, callback):
         """Set callback for refresh/retry OCR."""
         self._on_refresh_callback = callback
@@ -60,25 +117,31 @@ class MainWindow(Gtk.Window):
         self.set_modal(True)
         self.show_all()
         self._set_view(False)
+        self._start_tree_population()
         self._start_main()
 
     def _start_main(self):
-        """Start GTK main loop."""
-        self._gtk_main_running = True
-        Gtk.main()
+        """Run the main loop of this window."""
+        self._loop.run()
 
     def _cancel(self):
-        """Close the window and quit GTK main loop."""
-        if self._gtk_main_running:
-            Gtk.main_quit()
-            self._gtk_main_running = False
+        """Close the window and quit its main loop."""
+        if self._macro:
+            self._macro.close()
+        if self._loop.is_running():
+            self._loop.quit()
+
+    def _on_quit(self, widget, event=None):
+        """Handle window close and the Close menu item."""
+        self._cancel()
+        return False
 
     def _create_window(self):
         """Create the main window with all components."""
         Gtk.Window.__init__(self, title="OCR")
         self.set_default_size(700, 800)
 
-        self._grid = Gtk.Grid()
+        _register_accels()
         self._accelerators = Gtk.AccelGroup()
         self._menubar = Gtk.MenuBar()
 
@@ -103,14 +166,18 @@ class MainWindow(Gtk.Window):
         self._create_content_views()
 
         # Connect signals
-        self.connect("delete-event", Gtk.main_quit)
+        self.connect("delete-event", self._on_quit)
         self.connect('key-release-event', self._on_key_release)
 
-        # Layout
-        self._grid.attach(self._menubar, 0, 0, 10, 1)
-        self._grid.attach(self._keyboard_overlay_label, 0, 1, 10, 1)
-        self._grid.attach(self._font_button, 0, 11, 3, 1)
-        self.add(self._grid)
+        # Layout, the overlay label takes the place of the views in keyboard mode
+        font_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        font_box.pack_start(self._font_button, False, False, 0)
+        self._vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self._vbox.pack_start(self._menubar, False, False, 0)
+        self._vbox.pack_start(self._keyboard_overlay_label, True, True, 0)
+        self._vbox.pack_start(self._stack, True, True, 0)
+        self._vbox.pack_start(font_box, False, False, 0)
+        self.add(self._vbox)
 
     def _create_content_views(self):
         """Create text and tree views for OCR results."""
@@ -121,55 +188,129 @@ class MainWindow(Gtk.Window):
         self._textbox.set_vexpand(True)
         self._textbox.show()
         self._textbuffer = self._textbox.get_buffer()
+        # One user action, so the text and cursor change are handled as a batch
+        self._textbuffer.begin_user_action()
         self._textbuffer.set_text(self._ocr_text)
+        self._textbuffer.place_cursor(self._textbuffer.get_start_iter())
+        self._textbuffer.end_user_action()
+        self._line_word_offsets = None
         self._textbox.set_editable(False)
-        if self._textbuffer.get_start_iter() is not None:
-            self._textbuffer.place_cursor(self._textbuffer.get_start_iter())
         self._scrolled_window_text.add(self._textbox)
 
         # Tree view
         self._scrolled_window_tree = Gtk.ScrolledWindow()
         self._tree = Gtk.TreeView()
+        # Uniform row heights let the view lay out only the visible rows
+        self._tree.set_fixed_height_mode(True)
         self._tree.set_hexpand(True)
         self._tree.set_vexpand(True)
         self._tree.show()
         self._scrolled_window_tree.add(self._tree)
 
-        # Set up tree model
-        cols = [GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_INT,
-                GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_INT,
-                GObject.TYPE_INT, GObject.TYPE_INT]
-        model = Gtk.ListStore(*cols)
-        self._tree.set_model(model)
-
         # Hidden first column
         cell = Gtk.CellRendererText()
         column = Gtk.TreeViewColumn("OCR Text", cell, text=0)
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_fixed_width(120)
         column.set_visible(False)
         self._tree.append_column(column)
 
         # Visible columns
-        headers = ['OCR Text', 'Fontsize', 'Color', 'Object', 'X Position', 'Y Position', 'Confidence']
-        for i, header in enumerate(headers):
+        for i, header in enumerate(self._HEADERS):
             cell = Gtk.CellRendererText()
             column = Gtk.TreeViewColumn(header, cell, text=i + 1)
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(120)
             self._tree.append_column(column)
 
-        # Populate tree
-        model = self._tree.get_model()
-        for row in self._word_list:
-            row_iter = model.append(None)
-            for i, cell in enumerate(row):
-                col_index = i + 1
-                if col_index == 5:  # X position
-                    cell = cell / self._scale_factor + self._offset_x
-                if col_index == 6:  # Y position
-                    cell = cell / self._scale_factor + self._offset_y
-                model.set_value(row_iter, col_index, cell)
-
+        # The model is filled in the background, see _start_tree_population
+        self._tree_populated = False
+        self._populate_iter = None
+        self._pending_cursor = None
         self._tree.set_search_column(1)
-        self._grid.attach(self._scrolled_window_tree, 0, 1, 10, 10)
-        self._grid.attach(self._scrolled_window_text, 0, 1, 10, 10)
+
+        # Only the visible view is allocated and drawn
+        self._stack = Gtk.Stack()
+        self._stack.add_named(self._scrolled_window_text, "text")
+        self._stack.add_named(self._scrolled_window_tree, "tree")
+
+    def _start_tree_population(self):
+        """Fill the tree model from idle callbacks once the window is shown."""
+        if self._tree_populated or self._populate_iter is not None:
+            return
+        self._populate_iter = self._populate_tree_idle()
+        GLib.idle_add(self._on_populate_idle, priority=GLib.PRIORITY_DEFAULT_IDLE)
+
+    def _on_populate_idle(self):
+        """Add the next chunk of words to the tree model.
+
+        Returns:
+            bool: True while there are words left to add
+        """
+        if self._populate_iter is None:
+            return False
+        return next(self._populate_iter, False)
+
+    def _ensure_tree_populated(self):
+        """Finish filling the tree model right away.
+
+        Used when the user switches to the tree or acts on a selected word
+        before the idle callbacks have added every word.
+        """
+        if self._tree_populated:
+            return
+        if self._populate_iter is None:
+            self._populate_iter = self._populate_tree_idle()
+        for _ in self._populate_iter:
+            pass
+
+    def _populate_tree_idle(self):
+        """Generator that fills the tree model in chunks.
+
+        The model is attached to the view right away, so the rows show up
+        chunk by chunk. The view is in fixed height mode and does not measure
+        the added rows. Each append sets all cells in a single call, the hidden
+        first column is left unset.
+
+        Yields:
+            bool: True after each chunk of words
+        """
+        model = Gtk.ListStore(*self._COL_TYPES)
+        self._tree.set_model(model)
+
+        xs, ys = self._get_screen_positions()
+        # Screen positions by row, so a selection does not read them back from the model
+        self._coord_cache = list(zip(xs, ys))
+        for i, (row, x, y) in enumerate(zip(self._word_list, xs, ys), 1):
+            model.append([None, *row[:4], x, y, *row[6:]])
+            if i % _POPULATE_CHUNK_SIZE == 0:
+                yield True
+
+        self._tree_populated = True
+        self._populate_iter = None
+
+        if self._pending_cursor is not None:
+            self._tree.set_cursor(self._pending_cursor)
+            self._pending_cursor = None
+
+    def _get_screen_positions(self):
+        """Convert the word positions from the scaled OCR image to screen coordinates.
+
+        Returns:
+            tuple: (list of X positions, list of Y positions)
+        """
+        from .platform import numpy_available, np
+
+        if not numpy_available:
+            xs = [row[4] // self._scale_factor + self._offset_x for row in self._word_list]
+            ys = [row[5] // self._scale_factor + self._offset_y for row in self._word_list]
+            return xs, ys
+
+        count = len(self._word_list)
+        xs = np.fromiter((row[4] for row in self._word_list), dtype=np.int32, count=count)
+        ys = np.fromiter((row[5] for row in self._word_list), dtype=np.int32, count=count)
+        return ((xs // self._scale_factor + self._offset_x).tolist(),
+                (ys // self._scale_factor + self._offset_y).tolist())
 
     def _create_ocrdesktop_menu(self):
         """Create the OCRDesktop menu."""
@@ -177,7 +318,7 @@ class MainWindow(Gtk.Window):
 
         item_toggle_view = Gtk.MenuItem(label="Toggle V_iew")
         item_toggle_view.set_use_underline(True)
-        self._add_accelerator(item_toggle_view, "<Alt>v", "activate")
+        self._set_accel_path(item_toggle_view, "<OCRdesktop>/Toggle View")
         item_toggle_view.connect("activate", self._on_set_view, True)
 
         item_ocr_options = Gtk.MenuItem(label="_OCR Options")
@@ -206,18 +347,18 @@ class MainWindow(Gtk.Window):
 
         item_retry = Gtk.MenuItem(label="_Retry OCR")
         item_retry.set_use_underline(True)
-        self._add_accelerator(item_retry, "F5", "activate")
+        self._set_accel_path(item_retry, "<OCRdesktop>/Retry OCR")
         item_retry.connect("activate", self._on_refresh)
 
         item_clipboard = Gtk.MenuItem(label="Send to _Clipboard")
         item_clipboard.set_use_underline(True)
-        self._add_accelerator(item_clipboard, "<Control>b", "activate")
+        self._set_accel_path(item_clipboard, "<OCRdesktop>/Send to Clipboard")
         item_clipboard.connect("activate", self._on_send_to_clipboard)
 
         item_close = Gtk.MenuItem(label="_Close")
         item_close.set_use_underline(True)
-        self._add_accelerator(item_close, "<Control>q", "activate")
-        item_close.connect("activate", Gtk.main_quit)
+        self._set_accel_path(item_close, "<OCRdesktop>/Close")
+        item_close.connect("activate", self._on_quit)
 
         menu.append(item_toggle_view)
         menu.append(item_ocr_options)
@@ -236,37 +377,37 @@ class MainWindow(Gtk.Window):
 
         item_preclick = Gtk.CheckMenuItem(label="_Preclick")
         item_preclick.set_use_underline(True)
-        self._add_accelerator(item_preclick, "<Control>p", "activate")
+        self._set_accel_path(item_preclick, "<OCRdesktop>/Preclick")
         item_preclick.connect("activate", self._set_save_to_macro)
 
         item_left = Gtk.MenuItem(label="_Left Click")
         item_left.set_use_underline(True)
-        self._add_accelerator(item_left, "<Control>l", "activate")
+        self._set_accel_path(item_left, "<OCRdesktop>/Left Click")
         item_left.connect("activate", self._on_left_click)
 
         item_double = Gtk.MenuItem(label="_Double Click")
         item_double.set_use_underline(True)
-        self._add_accelerator(item_double, "<Control>d", "activate")
+        self._set_accel_path(item_double, "<OCRdesktop>/Double Click")
         item_double.connect("activate", self._on_double_click)
 
         item_right = Gtk.MenuItem(label="_Right Click")
         item_right.set_use_underline(True)
-        self._add_accelerator(item_right, "<Control>r", "activate")
+        self._set_accel_path(item_right, "<OCRdesktop>/Right Click")
         item_right.connect("activate", self._on_right_click)
 
         item_middle = Gtk.MenuItem(label="_Middle Click")
         item_middle.set_use_underline(True)
-        self._add_accelerator(item_middle, "<Control>m", "activate")
+        self._set_accel_path(item_middle, "<OCRdesktop>/Middle Click")
         item_middle.connect("activate", self._on_middle_click)
 
         item_route = Gtk.MenuItem(label="Route _To")
         item_route.set_use_underline(True)
-        self._add_accelerator(item_route, "<Control>t", "activate")
+        self._set_accel_path(item_route, "<OCRdesktop>/Route To")
         item_route.connect("activate", self._route_to_point)
 
         item_sendkey = Gtk.MenuItem(label="Send _Key")
         item_sendkey.set_use_underline(True)
-        self._add_accelerator(item_sendkey, "<Control>k", "activate")
+        self._set_accel_path(item_sendkey, "<OCRdesktop>/Send Key")
         item_sendkey.connect("activate", self._send_key_mode)
 
         menu.append(item_preclick)
@@ -284,26 +425,29 @@ class MainWindow(Gtk.Window):
 
     def _create_macro_menu(self):
         """Create the Macro menu."""
+        if self._macro is None:
+            return
+
         menu = Gtk.Menu()
 
         item_save = Gtk.MenuItem(label="_Save As")
         item_save.set_use_underline(True)
-        self._add_accelerator(item_save, "<Control>s", "activate")
-        item_save.connect("activate", self._macro._on_save_macro if self._macro else lambda w: None, self)
+        self._set_accel_path(item_save, "<OCRdesktop>/Macro/Save As")
+        item_save.connect("activate", self._macro._on_save_macro, self)
 
         item_load = Gtk.MenuItem(label="_Load")
         item_load.set_use_underline(True)
-        self._add_accelerator(item_load, "<Control>o", "activate")
-        item_load.connect("activate", self._macro._on_load_macro if self._macro else lambda w: None, self)
+        self._set_accel_path(item_load, "<OCRdesktop>/Macro/Load")
+        item_load.connect("activate", self._macro._on_load_macro, self)
 
         item_delete = Gtk.MenuItem(label="_Unload")
         item_delete.set_use_underline(True)
-        self._add_accelerator(item_delete, "<Control>u", "activate")
-        item_delete.connect("activate", self._macro._on_delete_macro if self._macro else lambda w: None, False)
+        self._set_accel_path(item_delete, "<OCRdesktop>/Macro/Unload")
+        item_delete.connect("activate", self._macro._on_delete_macro, False)
 
         item_run = Gtk.MenuItem(label="_Run")
         item_run.set_use_underline(True)
-        self._add_accelerator(item_run, "<Control>n", "activate")
+        self._set_accel_path(item_run, "<OCRdesktop>/Macro/Run")
         item_run.connect("activate", self._on_run_macro)
 
         menu.append(item_save)
@@ -331,11 +475,9 @@ class MainWindow(Gtk.Window):
         item_help.set_submenu(menu)
         self._menubar.append(item_help)
 
-    def _add_accelerator(self, widget, accelerator, signal="activate"):
-        """Add keyboard shortcut to widget."""
-        if accelerator is not None:
-            key, mod = Gtk.accelerator_parse(accelerator)
-            widget.add_accelerator(signal, self._accelerators, key, mod, Gtk.AccelFlags.VISIBLE)
+    def _set_accel_path(self, widget, path):
+        """Bind a registered accelerator path to a widget."""
+        Gtk.Widget.set_accel_path(widget, path, self._accelerators)
 
     def _on_font_set(self, widget):
         """Handle font selection."""
@@ -348,33 +490,57 @@ class MainWindow(Gtk.Window):
 
     def _set_view(self, toggle):
         """Set the current view (text or tree)."""
-        self._scrolled_window_tree.hide()
-        self._scrolled_window_text.hide()
-        self._keyboard_overlay_label.hide()
-
         if self._keyboard_overlay_active:
+            self._stack.hide()
             self._keyboard_overlay_label.show()
             return
 
+        self._keyboard_overlay_label.hide()
+        self._stack.show()
+
         self._set_focus()
 
         if toggle:
             self._view_mode = 1 if self._view_mode == 0 else 0
 
         if self._view_mode == 1:
-            self._scrolled_window_tree.show()
+            self._ensure_tree_populated()
+            self._stack.set_visible_child_name("tree")
             self._tree.grab_focus()
         else:
-            self._scrolled_window_text.show()
+            self._stack.set_visible_child_name("text")
             self._textbox.grab_focus()
 
     def _set_focus(self):
         """Sync focus between views."""
         if self._view_mode == 0 and self._textbuffer:
-            position = self._textbuffer.get_iter_at_offset(self._textbuffer.props.cursor_position)
-            if self._textbuffer.get_start_iter() is not None:
-                text = self._textbuffer.get_text(self._textbuffer.get_start_iter(), position, True)
-                self._tree.set_cursor(text.count('\n') + text.count(' '))
+            position = self._textbuffer.get_iter_at_mark(self._textbuffer.get_insert())
+            line = position.get_line()
+            if self._line_word_offsets is None:
+                self._line_word_offsets = self._get_line_word_offsets()
+            if line < len(self._line_word_offsets):
+                # Only the current line up to the cursor is copied out of the buffer
+                line_start = position.copy()
+                line_start.set_line_offset(0)
+                text = self._textbuffer.get_text(line_start, position, True)
+                index = self._line_word_offsets[line] + text.count(' ')
+                if self._tree_populated:
+                    self._tree.set_cursor(index)
+                else:
+                    self._pending_cursor = index
+
+    def _get_line_word_offsets(self):
+        """Get the tree row index of the first word on each text line.
+
+        Returns:
+            list: Row index for every line, counting one row per space and line break
+        """
+        offsets = []
+        index = 0
+        for line in self._ocr_text.split('\n'):
+            offsets.append(index)
+            index += line.count(' ') + 1
+        return offsets
 
     def _toggle_grayscale(self, widget):
         """Toggle grayscale option."""
@@ -403,7 +569,7 @@ class MainWindow(Gtk.Window):
 
     def _set_text_to_clipboard(self, text):
         """Set text to system clipboard."""
-        if not ui_available:
+        if not platform.ui_available:
             return
         if self._debug:
             print("----_setTextToClipboard Start--")
@@ -412,7 +578,8 @@ class MainWindow(Gtk.Window):
         try:
             clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             clipboard.set_text(text, -1)
-            clipboard.store()
+            # Hand the text to the clipboard manager once the menu handler has returned
+            GLib.idle_add(clipboard.store)
         except Exception:
             pass
 
@@ -424,17 +591,17 @@ class MainWindow(Gtk.Window):
         """Get selected entry coordinates from tree view."""
         if not self._tree:
             return None
+        self._ensure_tree_populated()
 
         selection = self._tree.get_selection()
         if not selection:
             return None
 
-        model, paths = selection.get_selected_rows()
+        _, paths = selection.get_selected_rows()
         if not paths:
             return None
 
-        return (model.get_value(model.get_iter(paths[0]), 5),
-                model.get_value(model.get_iter(paths[0]), 6))
+        return self._coord_cache[paths[0].get_indices()[0]]
 
     # Click handlers (X11 only)
     def _on_left_click(self, widget):
@@ -443,7 +610,7 @@ class MainWindow(Gtk.Window):
         coords = self._get_selected_entry()
         if coords:
             self.hide()
-            _thread.start_new_thread(self._thread_do_click, (coords[0], coords[1], "b1c"))
+            self._queue_action(self._thread_do_click, coords[0], coords[1], "b1c")
 
     def _on_double_click(self, widget):
         """Handle double click action."""
@@ -451,7 +618,7 @@ class MainWindow(Gtk.Window):
         coords = self._get_selected_entry()
         if coords:
             self.hide()
-            _thread.start_new_thread(self._thread_do_click, (coords[0], coords[1], "b1d"))
+            self._queue_action(self._thread_do_click, coords[0], coords[1], "b1d")
 
     def _on_right_click(self, widget):
         """Handle right click action."""
@@ -459,7 +626,7 @@ class MainWindow(Gtk.Window):
         coords = self._get_selected_entry()
         if coords:
             self.hide()
-            _thread.start_new_thread(self._thread_do_click, (coords[0], coords[1], "b3c"))
+            self._queue_action(self._thread_do_click, coords[0], coords[1], "b3c")
 
     def _on_middle_click(self, widget):
         """Handle middle click action."""
@@ -467,7 +634,7 @@ class MainWindow(Gtk.Window):
         coords = self._get_selected_entry()
         if coords:
             self.hide()
-            _thread.start_new_thread(self._thread_do_click, (coords[0], coords[1], "b2c"))
+            self._queue_action(self._thread_do_click, coords[0], coords[1], "b2c")
 
     def _route_to_point(self, widget):
         """Route mouse to selected point."""
@@ -475,10 +642,35 @@ class MainWindow(Gtk.Window):
         self.hide()
         coords = self._get_selected_entry()
         if coords:
-            _thread.start_new_thread(self._thread_route_to, (coords[0], coords[1]))
+            self._queue_action(self._thread_route_to, coords[0], coords[1])
+
+    def _queue_action(self, func, *args):
+        """Run a function on the worker thread.
+
+        Args:
+            func: Function to call
+            *args: Arguments for the function
+        """
+        if self._action_worker is None:
+            self._action_worker = threading.Thread(target=self._action_worker_loop, daemon=True)
+            self._action_worker.start()
+        self._action_queue.put((func, args))
+
+    def _action_worker_loop(self):
+        """Run queued actions one after another."""
+        while True:
+            func, args = self._action_queue.get()
+            # A failing action must not stop the worker, later actions would never run
+            try:
+                func(*args)
+            except Exception as e:
+                if self._debug:
+                    print(f"action {func.__name__} failed: {e}")
 
     def _thread_do_click(self, x, y, mouse_event, delay=0.8):
         """Perform click in thread."""
+        from .platform import pyatspi
+
         if pyatspi is None:
             self._cancel()
             return
@@ -492,6 +684,8 @@ class MainWindow(Gtk.Window):
 
     def _thread_route_to(self, x, y, delay=0.8):
         """Route mouse to point in thread."""
+        from .platform import pyatspi
+
         if pyatspi is None:
             self._cancel()
             return
@@ -505,6 +699,8 @@ class MainWindow(Gtk.Window):
 
     def _send_key_mode(self, widget):
         """Enter send key mode."""
+        from .platform import pyatspi
+
         if pyatspi is None:
             return
 
@@ -512,6 +708,11 @@ class MainWindow(Gtk.Window):
         if self._debug:
             print("sendKeyMode")
 
+        # Looked up once, _on_send_key runs synchronously for every key event
+        self._atspi = pyatspi
+        self._key_pressed_event = pyatspi.Atspi.EventType.KEY_PRESSED_EVENT
+        self._key_released_event = pyatspi.Atspi.EventType.KEY_RELEASED_EVENT
+
         pyatspi.Registry.registerKeystrokeListener(
             self._on_send_key,
             mask=pyatspi.allModifiers(),
@@ -524,10 +725,10 @@ class MainWindow(Gtk.Window):
             print("Keyboardlistener is registered")
 
     def _on_send_key(self, event):
-        """Handle keyboard events in send key mode."""
-        if pyatspi is None:
-            return True
+        """Handle keyboard events in send key mode.
 
+        Only registered by _send_key_mode, which stores pyatspi and the event types.
+        """
         if self._debug:
             print("_onSendKey")
             print(f'Type: {event.type}')
@@ -535,29 +736,32 @@ class MainWindow(Gtk.Window):
             print(f'ID: {event.id}')
             print(f'hw_code: {event.hw_code}')
 
-        if event.type == pyatspi.Atspi.EventType.KEY_PRESSED_EVENT:
-            if event.event_string == 'F4':
-                self._keyboard_overlay_active = False
-                self._set_view(False)
-                pyatspi.Registry.deregisterKeystrokeListener(self._on_send_key)
-                if self._debug:
-                    print('deregisterKeystrokeListener')
-                return True
+        event_type = event.type
+        if event_type == self._key_pressed_event and event.event_string == 'F4':
+            self._keyboard_overlay_active = False
+            self._set_view(False)
+            self._atspi.Registry.deregisterKeystrokeListener(self._on_send_key)
+            if self._debug:
+                print('deregisterKeystrokeListener')
+            return True
+
+        if self._macro is None:
+            return True
+
+        if event_type == self._key_pressed_event:
             event_type_id = 0
-        elif event.type == pyatspi.Atspi.EventType.KEY_RELEASED_EVENT:
+        elif event_type == self._key_released_event:
             event_type_id = 1
         else:
             event_type_id = 2
-
-        if self._macro:
-            self._macro.write_keyboard_to_macro(0, event.event_string, event_type_id)
+        self._macro.write_keyboard_to_macro(0, event.event_string, event_type_id)
         return True
 
     def _on_run_macro(self, widget):
         """Run loaded macro."""
         if self._macro and self._macro.macro_exists():
             self.hide()
-            _thread.start_new_thread(self._thread_run_macro, ())
+            self._queue_action(self._thread_run_macro)
         else:
             dialog = Gtk.MessageDialog(
                 self, 0, Gtk.MessageType.INFO,
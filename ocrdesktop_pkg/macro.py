@@ -2,11 +2,20 @@
 
 import os
 import shutil
+import threading
 import time
-import _thread
+from functools import cached_property
 
 from .constants import KEY_CODE, __version__, __appname__, __authors__, __website__, __copyright__, __license__, __comments__
-from .platform import ui_available, display_server, Gtk, Gdk, pyatspi
+
+# Active macro, shared by every OCRdesktop run of the user
+_MACRO_FILE = os.path.expanduser('~/.activeOCRMacro.ocrm')
+
+# Recorded macro entries are written once this many are buffered
+_FLUSH_ENTRIES = 64
+
+# Longest time in milliseconds a recorded entry stays in the buffer
+_FLUSH_INTERVAL_MS = 250
 
 
 class MacroManager:
@@ -14,8 +23,13 @@ class MacroManager:
 
     def __init__(self, debug=False):
         self._debug = debug
-        self._macro_file = os.path.expanduser('~') + '/.activeOCRMacro.ocrm'
-        self._macro_finished = False
+        self._macro_file = _MACRO_FILE
+        self._macro_finished = threading.Event()
+        self._steps = None
+        self._write_buf = []
+        self._write_lock = threading.Lock()
+        self._fd = None
+        self._flush_source = None
         self._gui = None
         self._cancel_button = None
         self._run_button = None
@@ -25,9 +39,24 @@ class MacroManager:
         self._grid = None
         self._label = None
 
+    @cached_property
+    def _event_types(self):
+        """AT-SPI key event types, indexed by their id in the macro file."""
+        from .platform import pyatspi
+
+        if pyatspi is None:
+            return ()
+        return (pyatspi.KEY_PRESS, pyatspi.KEY_RELEASE, pyatspi.KEY_PRESSRELEASE)
+
+    @cached_property
+    def _event_type_ids(self):
+        """Ids in the macro file of the AT-SPI key event types."""
+        return {event_type: i for i, event_type in enumerate(self._event_types)}
+
     def macro_exists(self):
         """Check if a macro file exists."""
-        return os.path.exists(self._macro_file) and os.path.isfile(self._macro_file)
+        self.flush()
+        return os.path.isfile(self._macro_file)
 
     def load_macro_file(self, macro_path):
         """Load a macro from file.
@@ -36,15 +65,19 @@ class MacroManager:
             macro_path: Path to macro file
         """
         if self._load_macro_exists(macro_path):
+            self.flush()
             if macro_path != self._macro_file:
                 shutil.copy(macro_path, self._macro_file)
+            self._steps = self._parse_macro()
 
     def _load_macro_exists(self, path):
         """Check if a loadable macro file exists."""
-        return os.path.exists(path) and os.path.isfile(path)
+        return os.path.isfile(path)
 
     def delete_macro(self):
         """Delete the active macro file."""
+        self._discard_writes()
+        self._steps = None
         if self.macro_exists():
             os.remove(self._macro_file)
 
@@ -55,35 +88,54 @@ class MacroManager:
                 print("No Macro loaded..")
             return
 
-        self._macro_finished = False
-        with open(self._macro_file, "r") as f:
-            for line in f:
+        self._macro_finished.clear()
+        try:
+            if self._steps is None:
+                self._steps = self._parse_macro()
+
+            for step, args in self._steps:
                 if self._debug:
-                    print(f"_RunMacro: {line}")
-                parts = line.strip().split(',')
+                    print(f"_RunMacro: {step.__name__} {args}")
+                step(*args)
+        finally:
+            self._macro_finished.set()
 
+    def _parse_macro(self):
+        """Read the macro file into a list of ready to call steps.
+
+        Returns:
+            list: (function, args) tuples, numeric fields are already converted
+        """
+        with open(self._macro_file, "r") as f:
+            data = f.read()
+
+        steps = []
+        for line in data.splitlines():
+            parts = line.strip().split(',')
+            try:
                 if parts[0] == 'c':
                     if parts[1] == 'delay':
-                        time.sleep(float(parts[2]))
+                        steps.append((time.sleep, (float(parts[2]),)))
                 elif parts[0] == 'k':
-                    self._do_keyboard_step(int(parts[1]), parts[2], int(parts[3]))
+                    steps.append((self._do_keyboard_step, (int(parts[1]), parts[2], int(parts[3]))))
                 elif parts[0] == 'm':
-                    self._do_mouse_step(int(parts[1]), int(parts[2]), parts[3])
-
-        self._macro_finished = True
+                    steps.append((self._do_mouse_step, (int(parts[1]), int(parts[2]), parts[3])))
+            except (IndexError, ValueError):
+                if self._debug:
+                    print(f"invalid macro line: {line}")
+        return steps
 
     def get_macro_finished(self):
         """Check if macro execution is finished."""
-        return self._macro_finished
+        return self._macro_finished.is_set()
 
     def wait_for_finish(self):
         """Wait for macro execution to complete."""
-        while not self.get_macro_finished() and self.macro_exists():
-            time.sleep(0.3)
+        # Woken as soon as the macro finishes, the timeout only covers an unloaded macro
+        while not self._macro_finished.wait(0.3) and self.macro_exists():
             if self._debug:
                 print(self.get_macro_finished())
-        time.sleep(0.2)
-        self._macro_finished = False
+        self._macro_finished.clear()
         if self._debug:
             print("WaitForFinish complete")
 
@@ -95,20 +147,14 @@ class MacroManager:
             key_string: Key string representation
             event_type: Event type (press/release)
         """
+        from .platform import pyatspi
+
         if pyatspi is None:
             return
 
-        if event_type == pyatspi.KEY_PRESS:
-            event_type_id = 0
-        elif event_type == pyatspi.KEY_RELEASE:
-            event_type_id = 1
-        elif event_type == pyatspi.KEY_PRESSRELEASE:
-            event_type_id = 2
-        else:
-            event_type_id = event_type
+        event_type_id = self._event_type_ids.get(event_type, event_type)
 
-        with open(self._macro_file, "a") as f:
-            f.write(f'k,{key_value},{key_string},{event_type_id}\n')
+        self._queue_macro_lines(f'k,{key_value},{key_string},{event_type_id}\n')
 
     def write_mouse_to_macro(self, x, y, mouse_event):
         """Write a mouse event to macro file.
@@ -118,9 +164,69 @@ class MacroManager:
             y: Y coordinate
             mouse_event: Mouse event type
         """
-        with open(self._macro_file, "a") as f:
-            f.write('c,delay,0.9\n')
-            f.write(f'm,{x},{y},{mouse_event}\n')
+        self._queue_macro_lines('c,delay,0.9\n', f'm,{x},{y},{mouse_event}\n')
+
+    def flush(self):
+        """Write all buffered macro entries to the macro file."""
+        with self._write_lock:
+            self._flush_locked()
+
+    def close(self):
+        """Write all buffered macro entries and close the macro file."""
+        with self._write_lock:
+            self._flush_locked()
+            self._close_locked()
+
+    def _queue_macro_lines(self, *lines):
+        """Buffer macro entries for writing.
+
+        The buffer is written once it holds _FLUSH_ENTRIES entries, or after
+        _FLUSH_INTERVAL_MS at the latest.
+
+        Args:
+            *lines: Macro entries, each terminated with a newline
+        """
+        from .platform import GLib
+
+        with self._write_lock:
+            self._write_buf.extend(lines)
+            if len(self._write_buf) >= _FLUSH_ENTRIES or GLib is None:
+                self._flush_locked()
+            elif self._flush_source is None:
+                self._flush_source = GLib.timeout_add(_FLUSH_INTERVAL_MS, self._on_flush_timeout)
+
+    def _on_flush_timeout(self):
+        """Write buffered macro entries from the flush timer."""
+        with self._write_lock:
+            self._flush_source = None
+            self._flush_locked()
+        return False
+
+    def _flush_locked(self):
+        """Write buffered macro entries with a single write, the lock must be held."""
+        if not self._write_buf:
+            return
+        self._steps = None
+        if self._fd is None:
+            self._fd = os.open(self._macro_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, ''.join(self._write_buf).encode())
+        self._write_buf.clear()
+
+    def _close_locked(self):
+        """Close the macro file and stop the flush timer, the lock must be held."""
+        if self._flush_source is not None:
+            from .platform import GLib
+            GLib.source_remove(self._flush_source)
+            self._flush_source = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _discard_writes(self):
+        """Drop buffered macro entries and close the macro file."""
+        with self._write_lock:
+            self._write_buf.clear()
+            self._close_locked()
 
     def _do_keyboard_step(self, key_value, key_string, event_type):
         """Execute a keyboard macro step.
@@ -130,6 +236,8 @@ class MacroManager:
             key_string: Key string for composed input
             event_type: 0=press, 1=release, 2=pressrelease
         """
+        from .platform import pyatspi
+
         if pyatspi is None:
             return
 
@@ -141,12 +249,8 @@ class MacroManager:
                     print(f"invalid keyboard macro: {key_value}, {key_string}")
                 return
 
-        if event_type == 0:
-            pyatspi.Registry.generateKeyboardEvent(key_value, key_string, pyatspi.KEY_PRESS)
-        elif event_type == 1:
-            pyatspi.Registry.generateKeyboardEvent(key_value, key_string, pyatspi.KEY_RELEASE)
-        elif event_type == 2:
-            pyatspi.Registry.generateKeyboardEvent(key_value, key_string, pyatspi.KEY_PRESSRELEASE)
+        if 0 <= event_type < len(self._event_types):
+            pyatspi.Registry.generateKeyboardEvent(key_value, key_string, self._event_types[event_type])
 
     def _do_mouse_step(self, x, y, mouse_event, pos_relation="abs"):
         """Execute a mouse macro step.
@@ -157,6 +261,8 @@ class MacroManager:
             mouse_event: Mouse event type
             pos_relation: Position relation (default: absolute)
         """
+        from .platform import pyatspi
+
         if pyatspi is None:
             return
 
@@ -173,6 +279,8 @@ class MacroManager:
     # GUI methods
     def show_gui(self):
         """Show the macro manager GUI."""
+        from .platform import Gtk
+
         if not self.macro_exists():
             return
 
@@ -185,6 +293,8 @@ class MacroManager:
 
     def _create_gui(self):
         """Create the macro manager GUI window."""
+        from .platform import Gtk
+
         dialog = Gtk.Window(title="Preclicks Manager")
         dialog.set_default_size(500, 60)
         dialog.set_modal(True)
@@ -269,6 +379,8 @@ class MacroManager:
 
     def _add_accelerator(self, widget, accelerator, signal="activate"):
         """Add keyboard shortcut to widget."""
+        from .platform import Gtk
+
         if accelerator is not None:
             key, mod = Gtk.accelerator_parse(accelerator)
             widget.add_accelerator(signal, self._accelerators, key, mod, Gtk.AccelFlags.VISIBLE)
@@ -276,7 +388,7 @@ class MacroManager:
     def _on_run_macro(self, widget):
         """Handle run macro button click."""
         self._gui.hide()
-        _thread.start_new_thread(self.thread_run_macro, ())
+        threading.Thread(target=self.thread_run_macro, daemon=True).start()
         self._cancel(False)
 
     def _on_delete_macro(self, widget, close=True):
@@ -291,14 +403,19 @@ class MacroManager:
 
     def _cancel(self, set_finished):
         """Close the GUI."""
+        from .platform import Gtk
+
+        self.close()
         if self._gui is not None:
             self._gui.hide()
         if set_finished:
-            self._macro_finished = True
+            self._macro_finished.set()
         Gtk.main_quit()
 
     def _on_save_macro(self, widget, window):
         """Handle save macro menu item."""
+        from .platform import Gtk
+
         if not self.macro_exists():
             return
 
@@ -314,11 +431,14 @@ class MacroManager:
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
+            self.flush()
             shutil.copy(self._macro_file, dialog.get_filename())
         dialog.destroy()
 
     def _on_load_macro(self, widget, window):
         """Handle load macro menu item."""
+        from .platform import Gtk
+
         dialog = Gtk.FileChooserDialog(
             "Please choose a file", window, Gtk.FileChooserAction.OPEN,
             ("_Cancel", Gtk.ResponseType.CANCEL, "_Open", Gtk.ResponseType.OK)
@@ -330,11 +450,15 @@ class MacroManager:
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
+            self.flush()
             shutil.copy(dialog.get_filename(), self._macro_file)
+            self._steps = None
         dialog.destroy()
 
     def _add_file_filters(self, dialog):
         """Add file filters to file chooser dialog."""
+        from .platform import Gtk
+
         filter_text = Gtk.FileFilter()
         filter_text.set_name("Macro Textfiles")
         filter_text.add_mime_type("text/plain")
@@ -348,6 +472,8 @@ class MacroManager:
 
     def _on_about_dialog(self, widget, window):
         """Show about dialog."""
+        from .platform import Gtk
+
         dialog = Gtk.AboutDialog(window)
         dialog.set_authors(__authors__)
         dialog.set_website(__website__)
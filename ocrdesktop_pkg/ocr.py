@@ -1,11 +1,103 @@
 """OCR processing functionality using Tesseract."""
 
+import functools
+import itertools
+import os
 import re
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import pytesseract
 from pytesseract import Output
 from PIL import Image, ImageOps
 
+# Modes that can be handed to tesseract as an uncompressed PBM/PGM/PPM file
+_PNM_MODES = ('1', 'L', 'RGB')
+# Memory backed storage for those files, used while it has room for them
+_SHM_DIR = '/dev/shm'
+
+# Patterns used by OCRProcessor._clean_text
+_RE_DOUBLE_SPACES = re.compile(r'[^\S\r\n]{2,}')
+# A whitespace run with line breaks, plus the first whitespace after its last line break
+_RE_LINE_BREAK = re.compile(r'\s*\n[^\S\n]?')
+
+
+# Default limit for images OCRed in parallel. Every worker holds a page
+# scaled up for OCR plus its PNM copy, often hundreds of MB together, so
+# peak memory grows with the worker count rather than with the CPU count.
+_MAX_OCR_WORKERS = 4
+
+
+def _ocr_concurrency():
+    """Get the number of images to OCR in parallel.
+
+    Returns:
+        int: Value of the OCR_CONCURRENCY environment variable, or the CPU
+            count limited to _MAX_OCR_WORKERS
+    """
+    try:
+        return max(1, int(os.environ['OCR_CONCURRENCY']))
+    except (KeyError, ValueError):
+        return min(os.cpu_count() or 1, _MAX_OCR_WORKERS)
+
+
+def _pnm_dir(img):
+    """Get the directory to write the PNM file of an image to.
+
+    Uncompressed, a scaled up screenshot is hundreds of MB and several
+    are written at once. /dev/shm is only used when it has room for a few
+    of them, containers often limit it to 64 MB.
+
+    Args:
+        img: PIL Image in one of _PNM_MODES
+
+    Returns:
+        str: /dev/shm, or None for the default temp directory
+    """
+    size = img.width * img.height * len(img.getbands())
+    try:
+        stat = os.statvfs(_SHM_DIR)
+    except (OSError, AttributeError):
+        return None
+    if stat.f_bavail * stat.f_frsize < size * _ocr_concurrency():
+        return None
+    return _SHM_DIR
+
+
+def _debug_image_path(name, index):
+    """Get the file name to save a debug image of a processed image to.
+
+    Images are transformed in parallel, so each one gets its own file.
+
+    Args:
+        name: Base name, like ocrScreenshotScaled
+        index: Position of the image in the processed list
+
+    Returns:
+        str: /tmp/<name>.png for the first image, /tmp/<name>_<index>.png for the others
+    """
+    if index == 0:
+        return f"/tmp/{name}.png"
+    return f"/tmp/{name}_{index}.png"
+
+
+@functools.lru_cache(maxsize=8)
+def _point_lut(invert, threshold):
+    """Get the lookup table that inverts and/or thresholds a single band.
+
+    Args:
+        invert: Whether to invert the values
+        threshold: Values above it become white and the rest black, None to keep them
+
+    Returns:
+        bytes: 256 entry table for Image.point
+    """
+    values = range(255, -1, -1) if invert else range(256)
+    if threshold is not None:
+        values = (255 if v > threshold else 0 for v in values)
+    return bytes(values)
+
 
 class OCRProcessor:
     """Handles OCR processing of images using Tesseract."""
@@ -18,6 +110,19 @@ class OCRProcessor:
         self._invert = False
         self._black_white = False
         self._black_white_value = 200
+        self._api = None
+        self._api_language = None
+        self._scaled_cache = {}  # id(source) -> (source, scale_factor, scaled image)
+
+    def close(self):
+        """Shut down the persistent Tesseract engine, if one is loaded.
+
+        Call it once OCR is done, the engine is not shut down on garbage collection.
+        """
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+            self._api_language = None
 
     @property
     def language(self):
@@ -59,15 +164,19 @@ class OCRProcessor:
     def black_white_value(self, value):
         self._black_white_value = value
 
-    def process_images(self, images, offset_x=0, offset_y=0, color_callback=None, include_word_list=True):
+    def process_images(self, images, offset_x=0, offset_y=0, color_callback=None, include_word_list=True,
+                       include_modified_images=True):
         """Process multiple images with OCR.
 
         Args:
-            images: List of PIL Image objects
+            images: List of PIL Image objects, or of callables that return one.
+                A callable is only called when its image is processed.
             offset_x: X offset for coordinate calculation
             offset_y: Y offset for coordinate calculation
             color_callback: Optional callback for color detection
             include_word_list: Whether to build detailed word list
+            include_modified_images: Whether to return the transformed images.
+                Without them each one is released once its words are processed.
 
         Returns:
             tuple: (ocr_text, word_list, modified_images)
@@ -75,61 +184,159 @@ class OCRProcessor:
         if self._debug:
             print('start OCR')
 
-        ocr_text = ''
+        text_parts = []
         word_list = []
         modified_images = []
 
-        for img in images:
-            modified_img = self._transform_image(img)
-            modified_images.append(modified_img)
-            ocr_words = self._ocr_image(modified_img)
+        # Scaled copies are only worth keeping for images that are OCRed again,
+        # Retry OCR is only offered by the GUI, which needs the word list
+        cache = include_word_list
+        if cache:
+            self._scaled_cache = {key: entry for key, entry in self._scaled_cache.items()
+                                  if any(entry[0] is img for img in images)}
+        else:
+            self._scaled_cache = {}
+
+        for modified_img, ocr_words in self._prepare_images(images, cache):
+            if include_modified_images:
+                modified_images.append(modified_img)
             text, words = self._process_ocr_words(
                 ocr_words, modified_img, offset_x, offset_y,
                 color_callback, include_word_list
             )
-            ocr_text += text
+            text_parts.append(text)
             word_list.extend(words)
 
         if self._debug:
             print('OCR complete')
 
-        ocr_text = self._clean_text(ocr_text)
+        ocr_text = self._clean_text(''.join(text_parts))
         return ocr_text, word_list, modified_images
 
-    def _transform_image(self, img):
+    def _prepare_images(self, images, cache=True):
+        """Transform and OCR images, running Tesseract for several images in parallel.
+
+        With pytesseract each image is handled by its own tesseract process,
+        so threads are enough to keep several of them busy at once.
+
+        Args:
+            images: List of PIL Image objects or callables that return one
+            cache: Whether to keep the scaled images for the next run
+
+        Yields:
+            tuple: (modified_image, ocr_words) for each image, in order
+        """
+        from .platform import tesserocr_available
+
+        transform_and_ocr = functools.partial(self._transform_and_ocr, cache=cache)
+        # A tesserocr engine is a single instance and handles one image at a time
+        workers = 1 if tesserocr_available else min(len(images), _ocr_concurrency())
+        if workers <= 1:
+            for index, img in enumerate(images):
+                yield transform_and_ocr(img, index)
+            return
+
+        # Only as many images as there are workers are submitted ahead of the
+        # one being consumed, so finished results cannot pile up in memory
+        sources = enumerate(images)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(executor.submit(transform_and_ocr, img, index)
+                            for index, img in itertools.islice(sources, workers))
+            while pending:
+                result = pending.popleft().result()
+                for index, img in itertools.islice(sources, 1):
+                    pending.append(executor.submit(transform_and_ocr, img, index))
+                yield result
+
+    def _transform_and_ocr(self, source, index=0, cache=True):
+        """Transform a single image and run OCR on it.
+
+        Args:
+            source: PIL Image, or a callable that returns one
+            index: Position of the image in the processed list
+            cache: Whether to keep the scaled image of a PIL Image for the next run
+
+        Returns:
+            tuple: (modified_image, ocr_words)
+        """
+        if callable(source):
+            # Decoded on demand, the scaled copy is not kept for Retry OCR so
+            # that it can be released once its words are processed
+            modified_img = self._transform_image(source(), False, index)
+        else:
+            modified_img = self._transform_image(source, cache, index)
+        return modified_img, self._ocr_image(modified_img)
+
+    def _transform_image(self, img, cache=True, index=0):
         """Apply image transformations before OCR.
 
         Args:
             img: PIL Image
+            cache: Whether to keep the scaled image for the next run
+            index: Position of the image in the processed list, names debug images
 
         Returns:
             PIL.Image: Transformed image
         """
-        # Scale image
-        width, height = img.size
-        width *= self._scale_factor
-        height *= self._scale_factor
-        modified = img.resize((width, height), Image.Resampling.BICUBIC)
+        # Read the options once, this runs for every image and possibly in parallel
+        invert = self._invert
+        grayscale = self._grayscale
+        black_white = self._black_white
 
-        if self._debug:
-            modified.save("/tmp/ocrScreenshotScaled.png")
-            print("save scaled screenshot:/tmp/ocrScreenshotScaled.png")
+        modified = self._scale_image(img, cache, index)
 
-        # Apply transformations
-        if self._invert:
-            modified = ImageOps.invert(modified)
-        if self._grayscale:
+        # Apply transformations. Grayscale goes first, so that invert and
+        # black/white become a single lookup table pass over one band.
+        invert_lut = False
+        if grayscale:
             modified = ImageOps.grayscale(modified)
-        if self._black_white:
-            lut = [255 if v > self._black_white_value else 0 for v in range(256)]
-            modified = modified.point(lut)
+            invert_lut = invert
+        elif invert:
+            modified = ImageOps.invert(modified)
+        if invert_lut or black_white:
+            threshold = self._black_white_value if black_white else None
+            modified = modified.point(_point_lut(invert_lut, threshold))
 
         if self._debug:
-            modified.save("/tmp/ocrScreenshotTransformed.png")
-            print("save transformed screenshot:/tmp/ocrScreenshotTransformed.png")
+            debug_path = _debug_image_path("ocrScreenshotTransformed", index)
+            modified.save(debug_path)
+            print(f"save transformed screenshot:{debug_path}")
 
         return modified
 
+    def _scale_image(self, img, cache=True, index=0):
+        """Scale image up for OCR, reusing the result from an earlier run.
+
+        Retry OCR only changes the color transformations, so the expensive
+        resize of the same screenshot is done once.
+
+        Args:
+            img: PIL Image
+            cache: Whether to keep the scaled image for the next run
+            index: Position of the image in the processed list, names debug images
+
+        Returns:
+            PIL.Image: Scaled image
+        """
+        if self._scale_factor == 1:
+            return img
+
+        cached = self._scaled_cache.get(id(img))
+        if cached is not None and cached[0] is img and cached[1] == self._scale_factor:
+            return cached[2]
+
+        scaled = img.resize((img.width * self._scale_factor, img.height * self._scale_factor),
+                            Image.Resampling.BICUBIC)
+
+        if self._debug:
+            debug_path = _debug_image_path("ocrScreenshotScaled", index)
+            scaled.save(debug_path)
+            print(f"save scaled screenshot:{debug_path}")
+
+        if cache:
+            self._scaled_cache[id(img)] = (img, self._scale_factor, scaled)
+        return scaled
+
     def _ocr_image(self, img):
         """Run Tesseract OCR on image.
 
@@ -137,17 +344,111 @@ class OCRProcessor:
             img: PIL Image
 
         Returns:
-            dict: OCR results from pytesseract
+            dict: OCR results in the pytesseract image_to_data layout
         """
+        from .platform import tesserocr_available
+
         if img is None:
             return {}
+        if tesserocr_available:
+            return self._ocr_image_tesserocr(img)
+        if img.mode not in _PNM_MODES:
+            return self._run_tesseract(img)
+
+        # pytesseract would PNG encode the image first, a PNM file is just
+        # a header followed by the raw pixels
+        with tempfile.NamedTemporaryFile(prefix='ocrdesktop_', suffix='.pnm',
+                                         dir=_pnm_dir(img)) as pnm_file:
+            try:
+                img.save(pnm_file, format='PPM')
+                pnm_file.flush()
+            except OSError as e:
+                # Out of space, let pytesseract write its own compressed image instead
+                if self._debug:
+                    print(f"could not write PNM file: {e}")
+                return self._run_tesseract(img)
+            return self._run_tesseract(pnm_file.name)
+
+    def _run_tesseract(self, image):
+        """Run the tesseract command through pytesseract.
+
+        Args:
+            image: PIL Image or path to an image file
+
+        Returns:
+            dict: OCR results from pytesseract
+        """
         return pytesseract.image_to_data(
-            img,
+            image,
             output_type=Output.DICT,
             lang=self._language,
             config='--psm 4'
         )
 
+    def _get_api(self):
+        """Get the persistent tesserocr engine, loading it for the current language.
+
+        Keeping the engine loaded means a Retry OCR does not have to start
+        tesseract and load the language model again.
+
+        Returns:
+            tesserocr.PyTessBaseAPI: Initialized engine
+        """
+        from .platform import tesserocr
+
+        if self._api is not None and self._api_language != self._language:
+            self.close()
+        if self._api is None:
+            self._api = tesserocr.PyTessBaseAPI(lang=self._language, psm=tesserocr.PSM.SINGLE_COLUMN)
+            self._api_language = self._language
+        return self._api
+
+    def _ocr_image_tesserocr(self, img):
+        """Run OCR through the persistent tesserocr engine.
+
+        Args:
+            img: PIL Image
+
+        Returns:
+            dict: Word level OCR results in the pytesseract image_to_data layout
+        """
+        from .platform import tesserocr
+
+        keys = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                'left', 'top', 'width', 'height', 'conf', 'text')
+        ocr_words = {key: [] for key in keys}
+
+        api = self._get_api()
+        api.SetImage(img)
+        api.Recognize()
+        iterator = api.GetIterator()
+        if iterator is None:
+            return ocr_words
+
+        ril = tesserocr.RIL
+        block_num = par_num = line_num = word_num = 0
+        for word in tesserocr.iterate_level(iterator, ril.WORD):
+            if word.IsAtBeginningOf(ril.BLOCK):
+                block_num += 1
+                par_num = 0
+            if word.IsAtBeginningOf(ril.PARA):
+                par_num += 1
+                line_num = 0
+            if word.IsAtBeginningOf(ril.TEXTLINE):
+                line_num += 1
+                word_num = 0
+            word_num += 1
+
+            bounding_box = word.BoundingBox(ril.WORD)
+            if bounding_box is None:
+                continue
+            x1, y1, x2, y2 = bounding_box
+            values = (5, 1, block_num, par_num, line_num, word_num,
+                      x1, y1, x2 - x1, y2 - y1, word.Confidence(ril.WORD), word.GetUTF8Text(ril.WORD) or '')
+            for key, value in zip(keys, values):
+                ocr_words[key].append(value)
+        return ocr_words
+
     def _process_ocr_words(self, ocr_words, img, offset_x, offset_y, color_callback, include_word_list):
         """Process OCR results into text and word list.
 
@@ -162,12 +463,26 @@ class OCRProcessor:
         Returns:
             tuple: (text, word_list)
         """
-        text = ''
+        if not include_word_list:
+            return self._text_only(ocr_words), []
+
+        parts = []
         word_list = []
 
         box_count = len(ocr_words.get('level', []))
         if box_count == 0:
-            return text, word_list
+            return '', word_list
+
+        texts = ocr_words['text']
+        pages = ocr_words['page_num']
+        blocks = ocr_words['block_num']
+        pars = ocr_words['par_num']
+        lines = ocr_words['line_num']
+        lefts = ocr_words['left']
+        tops = ocr_words['top']
+        widths = ocr_words['width']
+        heights = ocr_words['height']
+        confs = ocr_words['conf']
 
         last_page = -1
         last_block = -1
@@ -175,48 +490,74 @@ class OCRProcessor:
         last_line = -1
 
         for i in range(box_count):
-            word_text = ocr_words['text'][i]
+            word_text = texts[i]
             if not word_text or word_text.isspace():
                 continue
 
             # Handle line breaks
             if last_line != -1:
-                if (last_page != ocr_words['page_num'][i] or
-                    last_block != ocr_words['block_num'][i] or
-                    last_par != ocr_words['par_num'][i] or
-                    last_line != ocr_words['line_num'][i]):
-                    text += '\n'
+                if (last_page != pages[i] or
+                    last_block != blocks[i] or
+                    last_par != pars[i] or
+                    last_line != lines[i]):
+                    parts.append('\n')
                 else:
-                    text += ' '
+                    parts.append(' ')
 
-            text += word_text
+            parts.append(word_text)
 
             # Build word list for GUI
-            if include_word_list:
-                color = 'unknown'
-                if color_callback:
-                    color = color_callback(ocr_words, i, img)
-
-                x_pos = int(ocr_words['width'][i] / 2 + ocr_words['left'][i])
-                y_pos = int(ocr_words['height'][i] / 2 + ocr_words['top'][i])
-
-                word_list.append([
-                    word_text,
-                    round(ocr_words['height'][i] / 3 * 0.78, 0),  # Estimated font size
-                    color,
-                    'text',
-                    x_pos,
-                    y_pos,
-                    int(float(ocr_words['conf'][i]))  # Confidence
-                ])
-
-            last_page = ocr_words['page_num'][i]
-            last_block = ocr_words['block_num'][i]
-            last_par = ocr_words['par_num'][i]
-            last_line = ocr_words['line_num'][i]
-
-        text += '\n'
-        return text, word_list
+            color = 'unknown'
+            if color_callback:
+                color = color_callback(ocr_words, i, img)
+
+            x_pos = int(widths[i] / 2 + lefts[i])
+            y_pos = int(heights[i] / 2 + tops[i])
+
+            word_list.append([
+                word_text,
+                round(heights[i] / 3 * 0.78, 0),  # Estimated font size
+                color,
+                'text',
+                x_pos,
+                y_pos,
+                int(float(confs[i]))  # Confidence
+            ])
+
+            last_page = pages[i]
+            last_block = blocks[i]
+            last_par = pars[i]
+            last_line = lines[i]
+
+        parts.append('\n')
+        return ''.join(parts), word_list
+
+    def _text_only(self, ocr_words):
+        """Build the text of OCR results without the word list.
+
+        Args:
+            ocr_words: OCR results dictionary
+
+        Returns:
+            str: Words of each line separated by spaces, lines by newlines
+        """
+        if not ocr_words.get('level'):
+            return ''
+
+        parts = []
+        last_line_id = None
+        for word_text, line_id in zip(ocr_words['text'],
+                                      zip(ocr_words['page_num'], ocr_words['block_num'],
+                                          ocr_words['par_num'], ocr_words['line_num'])):
+            if not word_text or word_text.isspace():
+                continue
+            if last_line_id is not None:
+                parts.append(' ' if line_id == last_line_id else '\n')
+            parts.append(word_text)
+            last_line_id = line_id
+
+        parts.append('\n')
+        return ''.join(parts)
 
     def _clean_text(self, text):
         """Clean up OCR text output.
@@ -228,18 +569,22 @@ class OCRProcessor:
             str: Cleaned text
         """
         # Remove double spaces
-        text = re.compile(r'[^\S\r\n]{2,}').sub(' ', text)
-        # Remove empty lines
-        text = re.compile(r'\n\s*\n').sub('\n', text)
-        # Remove ending spaces
-        text = re.compile(r'\s*\n').sub('\n', text)
+        text = _RE_DOUBLE_SPACES.sub(' ', text)
+
+        # Remove the ending newline together with the spaces before it
+        body = text.rstrip()
+        tail = text[len(body):]
+        if '\n' in tail:
+            tail = tail[tail.rindex('\n') + 1:]
+            tail = '\n' + tail[1:] if tail else ''
+        elif not body:
+            tail = '\n' + tail[2:] if len(tail) > 1 else ''
+
+        # Remove empty lines, ending spaces and trailing spaces after
+        # newlines in a single pass
+        body = _RE_LINE_BREAK.sub('\n', body)
         # Remove trailing space in first line
-        text = re.compile(r'^\s').sub('\n', text)
-        # Remove ending newline
-        text = re.compile(r'$\n').sub('', text)
-        # Remove trailing spaces after newlines
-        text = re.compile(r'\n\s').sub('\n', text)
-
-        if text:
-            text = text[:-1]
-        return text
+        if body[:1].isspace() and body[0] != '\n':
+            body = '\n' + body[2:] if body[1:2].isspace() else '\n' + body[1:]
+
+        return (body + tail)[:-1]
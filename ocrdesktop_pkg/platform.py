@@ -1,10 +1,17 @@
 """Platform detection and conditional imports for OCRdesktop."""
 
+import functools
+import importlib.util
 import os
 
+
+@functools.lru_cache(maxsize=1)
 def detect_display_server():
     """Detect if running on Wayland or X11.
 
+    The result is cached, call detect_display_server.cache_clear() to
+    detect again after the environment changed.
+
     Returns:
         str: 'wayland', 'x11', or None if unknown
     """
@@ -21,56 +28,182 @@ def detect_display_server():
 # Detect display server at module load time
 display_server = detect_display_server()
 
-# Optional dependency flags
-pdf2image_available = True
-try:
-    from pdf2image import convert_from_path
-except ImportError:
-    pdf2image_available = False
-    convert_from_path = None
-
-scipy_available = True
-try:
-    from scipy.spatial import KDTree
-except ImportError:
-    scipy_available = False
-    KDTree = None
-
-webcolors_available = True
-try:
-    from webcolors import CSS2_HEX_TO_NAMES, CSS3_HEX_TO_NAMES, hex_to_rgb
-except ImportError:
-    webcolors_available = False
-    CSS2_HEX_TO_NAMES = None
-    CSS3_HEX_TO_NAMES = None
-    hex_to_rgb = None
-
-# GTK/GDK imports - these are required
-ui_available = True
-wnck_available = False
-pyatspi = None
-Wnck = None
-
-try:
-    import gi
-    gi.require_version("Gtk", "3.0")
-    gi.require_version("Gdk", "3.0")
-    from gi.repository import Gtk, Gdk, GObject, Gio, GLib
-
-    # Wnck is X11-only, skip on Wayland
-    if display_server != 'wayland':
-        gi.require_version("Wnck", "3.0")
+# Optional dependencies and the GI modules are imported on first access
+# through the module __getattr__ below, so importing this module stays cheap.
+
+
+def _load_pdf2image():
+    """Import pdf2image if it is installed."""
+    try:
+        from pdf2image import convert_from_path, pdfinfo_from_path
+    except ImportError:
+        return {'pdf2image_available': False, 'convert_from_path': None, 'pdfinfo_from_path': None}
+    return {'pdf2image_available': True, 'convert_from_path': convert_from_path,
+            'pdfinfo_from_path': pdfinfo_from_path}
+
+
+def _load_pypdfium2():
+    """Import pypdfium2 if it is installed."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return {'pypdfium2_available': False, 'pdfium': None}
+    return {'pypdfium2_available': True, 'pdfium': pdfium}
+
+
+def _load_tesserocr():
+    """Import tesserocr if it is installed."""
+    try:
+        import tesserocr
+    except ImportError:
+        return {'tesserocr_available': False, 'tesserocr': None}
+    return {'tesserocr_available': True, 'tesserocr': tesserocr}
+
+
+def _load_numpy():
+    """Import numpy if it is installed."""
+    try:
+        import numpy as np
+    except ImportError:
+        return {'numpy_available': False, 'np': None}
+    return {'numpy_available': True, 'np': np}
+
+
+def _load_numba():
+    """Import numba if it is installed."""
+    try:
+        from numba import njit
+    except ImportError:
+        return {'numba_available': False, 'njit': None}
+    return {'numba_available': True, 'njit': njit}
+
+
+def _load_webcolors():
+    """Import webcolors if it is installed."""
+    try:
+        from webcolors import CSS2_HEX_TO_NAMES, CSS3_HEX_TO_NAMES, hex_to_rgb
+    except ImportError:
+        return {'webcolors_available': False, 'CSS2_HEX_TO_NAMES': None,
+                'CSS3_HEX_TO_NAMES': None, 'hex_to_rgb': None}
+    return {'webcolors_available': True, 'CSS2_HEX_TO_NAMES': CSS2_HEX_TO_NAMES,
+            'CSS3_HEX_TO_NAMES': CSS3_HEX_TO_NAMES, 'hex_to_rgb': hex_to_rgb}
+
+
+@functools.lru_cache(maxsize=1)
+def _probe_ui():
+    """Check that the GTK stack is installed without loading its libraries.
+
+    Returns:
+        tuple: (ui_available, wnck_available)
+    """
+    wnck_available = False
+    try:
+        import gi
+        gi.require_version("Gtk", "3.0")
+        gi.require_version("Gdk", "3.0")
+
+        # Wnck and AT-SPI (mouse/keyboard interaction) are X11-only, skip on Wayland
+        if display_server != 'wayland':
+            gi.require_version("Wnck", "3.0")
+            wnck_available = True
+            gi.require_version('Atspi', '2.0')
+            # Only looked up, pyatspi is imported once it is used
+            if importlib.util.find_spec('pyatspi') is None:
+                return False, wnck_available
+    except Exception:
+        return False, wnck_available
+    return True, wnck_available
+
+
+def _load_flags():
+    """Get the UI availability flags.
+
+    A flag already cleared because its module failed to import is kept.
+    """
+    ui_available, wnck_available = _probe_ui()
+    flags = {'ui_available': ui_available, 'wnck_available': wnck_available}
+    return {name: value for name, value in flags.items() if name not in globals()}
+
+
+def _load_ui():
+    """Import the GTK/GDK modules.
+
+    ui_available is cleared if the import fails.
+    """
+    modules = dict.fromkeys(('Gtk', 'Gdk', 'GObject', 'Gio', 'GLib'))
+    if not _probe_ui()[0]:
+        return modules
+    try:
+        from gi.repository import Gtk, Gdk, GObject, Gio, GLib
+    except Exception:
+        modules['ui_available'] = False
+        return modules
+    modules.update(Gtk=Gtk, Gdk=Gdk, GObject=GObject, Gio=Gio, GLib=GLib)
+    return modules
+
+
+def _load_wnck():
+    """Import Wnck, which is only available on X11.
+
+    wnck_available is cleared if the import fails.
+    """
+    ui_available, wnck_available = _probe_ui()
+    if not (ui_available and wnck_available):
+        return {'Wnck': None}
+    try:
         from gi.repository import Wnck
-        wnck_available = True
+    except Exception:
+        return {'Wnck': None, 'wnck_available': False}
+    return {'Wnck': Wnck}
+
 
-    # AT-SPI (also X11-only for mouse/keyboard interaction)
-    if display_server != 'wayland':
-        gi.require_version('Atspi', '2.0')
+def _load_pyatspi():
+    """Import pyatspi, which is only available on X11.
+
+    ui_available is cleared if the import fails, as the UI needs it on X11.
+    """
+    if display_server == 'wayland' or not _probe_ui()[0]:
+        return {'pyatspi': None}
+    try:
         import pyatspi
-except Exception:
-    ui_available = False
-    Gtk = None
-    Gdk = None
-    GObject = None
-    Gio = None
-    GLib = None
+    except Exception:
+        return {'pyatspi': None, 'ui_available': False}
+    return {'pyatspi': pyatspi}
+
+
+_LAZY_LOADERS = {
+    'pdf2image_available': _load_pdf2image,
+    'convert_from_path': _load_pdf2image,
+    'pdfinfo_from_path': _load_pdf2image,
+    'pypdfium2_available': _load_pypdfium2,
+    'pdfium': _load_pypdfium2,
+    'tesserocr_available': _load_tesserocr,
+    'tesserocr': _load_tesserocr,
+    'numpy_available': _load_numpy,
+    'np': _load_numpy,
+    'numba_available': _load_numba,
+    'njit': _load_numba,
+    'webcolors_available': _load_webcolors,
+    'CSS2_HEX_TO_NAMES': _load_webcolors,
+    'CSS3_HEX_TO_NAMES': _load_webcolors,
+    'hex_to_rgb': _load_webcolors,
+    'ui_available': _load_flags,
+    'wnck_available': _load_flags,
+    'Gtk': _load_ui,
+    'Gdk': _load_ui,
+    'GObject': _load_ui,
+    'Gio': _load_ui,
+    'GLib': _load_ui,
+    'Wnck': _load_wnck,
+    'pyatspi': _load_pyatspi,
+}
+
+
+def __getattr__(name):
+    """Import an optional dependency on first access and cache it as a module global."""
+    loader = _LAZY_LOADERS.get(name)
+    if loader is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    values = loader()
+    globals().update(values)
+    return values[name]
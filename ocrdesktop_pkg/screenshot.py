@@ -1,34 +1,53 @@
 """Screenshot capture functionality for OCRdesktop."""
 
+import mmap
 import os
-import tempfile
+import threading
 from urllib.parse import urlparse, unquote
-from mimetypes import MimeTypes
 
 from PIL import Image
 
-from .platform import (
-    display_server, ui_available, wnck_available,
-    pdf2image_available, convert_from_path,
-    Gtk, Gdk, Gio, GLib, Wnck
-)
+# GI modules are imported where they are used, so that loading files or images
+# without a display does not load GTK
+from . import platform
+from .platform import display_server
 
 
-def pixbuf_to_image(pix):
+def _pixbuf_to_image_rgb(pix):
+    """Convert a GdkPixbuf without alpha channel to an RGB image."""
+    # RGB rows are not mappable, frombuffer copies them
+    return Image.frombuffer("RGB", (pix.props.width, pix.props.height), pix.get_pixels(),
+                            "raw", "RGB", pix.props.rowstride, 1)
+
+
+def _pixbuf_to_image_rgba(pix):
+    """Convert a GdkPixbuf with alpha channel to an RGBA image."""
+    # 4 byte per pixel data is mapped without copying, the image keeps a reference to it
+    return Image.frombuffer("RGBA", (pix.props.width, pix.props.height), pix.get_pixels(),
+                            "raw", "RGBA", pix.props.rowstride, 1)
+
+
+def _pixbuf_to_image_opaque(pix):
+    """Convert a GdkPixbuf with an opaque alpha channel to an RGB image."""
+    # The RGBX decoder skips the alpha byte of every pixel in C
+    return Image.frombytes("RGB", (pix.props.width, pix.props.height), pix.get_pixels(),
+                           "raw", "RGBX", pix.props.rowstride)
+
+
+def pixbuf_to_image(pix, opaque=False):
     """Convert GdkPixbuf to PIL Image.
 
     Args:
         pix: GdkPixbuf object
+        opaque: True if the alpha channel is known to be fully opaque, as
+            for screen captures. It is then dropped while decoding.
 
     Returns:
         PIL.Image: Converted image
     """
-    data = pix.get_pixels()
-    w = pix.props.width
-    h = pix.props.height
-    stride = pix.props.rowstride
-    mode = "RGBA" if pix.props.has_alpha else "RGB"
-    return Image.frombytes(mode, (w, h), data, "raw", mode, stride)
+    if not pix.props.has_alpha:
+        return _pixbuf_to_image_rgb(pix)
+    return (_pixbuf_to_image_opaque if opaque else _pixbuf_to_image_rgba)(pix)
 
 
 class ScreenshotCapture:
@@ -43,7 +62,7 @@ class ScreenshotCapture:
 
     @property
     def images(self):
-        """Get captured images."""
+        """Get captured images, PDF pages are callables that render the page."""
         return self._images
 
     @property
@@ -56,17 +75,19 @@ class ScreenshotCapture:
         """Get Y offset of captured window."""
         return self._offset_y
 
-    def capture(self, mode, file_path=''):
+    def capture(self, mode, file_path='', draft_mode=None):
         """Capture screenshot based on mode.
 
         Args:
             mode: 0=window, 1=desktop, 2=clipboard, 3=file
             file_path: Path to file (for mode 3)
+            draft_mode: Image mode OCR will convert to, e.g. 'L'. JPEG files
+                are then decoded straight into it (for mode 3)
 
         Returns:
             bool: True if capture was successful
         """
-        if not ui_available:
+        if not platform.ui_available:
             if self._debug:
                 print('GTK / GDK / GI is not available')
             return False
@@ -78,9 +99,17 @@ class ScreenshotCapture:
         elif mode == 2:  # Clipboard
             return self._capture_clipboard()
         elif mode == 3:  # File
-            return self._capture_file(file_path)
+            return self._capture_file(file_path, draft_mode)
         return False
 
+    def _save_debug_image(self):
+        """Save the captured image to /tmp/ocrScreenshot.png for debugging.
+
+        Uses fast PNG compression, the file is only a debug artifact.
+        """
+        self._images[0].save("/tmp/ocrScreenshot.png", compress_level=1)
+        print("save screenshot:/tmp/ocrScreenshot.png")
+
     def _capture_with_fallback(self):
         """Capture window with fallback to desktop."""
         try:
@@ -107,6 +136,8 @@ class ScreenshotCapture:
             return result
 
         # X11 path
+        from .platform import Gtk, Gdk, Wnck
+
         Gtk.main_iteration_do(False)  # Workaround for segfault
         gdk_desktop = Gdk.get_default_root_window()
 
@@ -122,10 +153,9 @@ class ScreenshotCapture:
             return False
 
         if pixbuf is not None:
-            self._images = [pixbuf_to_image(pixbuf)]
+            self._images = [pixbuf_to_image(pixbuf, opaque=True)]
             if self._debug:
-                self._images[0].save("/tmp/ocrScreenshot.png")
-                print("save screenshot:/tmp/ocrScreenshot.png")
+                self._save_debug_image()
             return True
         else:
             if self._debug:
@@ -140,14 +170,15 @@ class ScreenshotCapture:
             return self._capture_portal(interactive=False)
 
         # X11 path
+        from .platform import Gdk
+
         desktop = Gdk.get_default_root_window()
         pixbuf = Gdk.pixbuf_get_from_window(desktop, 0, 0, desktop.get_width(), desktop.get_height())
 
         if pixbuf is not None:
-            self._images = [pixbuf_to_image(pixbuf)]
+            self._images = [pixbuf_to_image(pixbuf, opaque=True)]
             if self._debug:
-                self._images[0].save("/tmp/ocrScreenshot.png")
-                print("save screenshot:/tmp/ocrScreenshot.png")
+                self._save_debug_image()
             return True
         else:
             if self._debug:
@@ -164,6 +195,8 @@ class ScreenshotCapture:
         Returns:
             bool: True if screenshot was successful
         """
+        from .platform import Gio, GLib
+
         try:
             bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
             proxy = Gio.DBusProxy.new_for_bus_sync(
@@ -182,7 +215,10 @@ class ScreenshotCapture:
             }))
 
             screenshot_path = None
-            loop = GLib.MainLoop()
+            # A private context, so that waiting for the portal only dispatches
+            # the response signal and the timeout, not the default context sources
+            context = GLib.MainContext.new()
+            loop = GLib.MainLoop.new(context, False)
 
             def on_response(connection, sender, path, interface, signal, params, user_data):
                 nonlocal screenshot_path
@@ -214,31 +250,52 @@ class ScreenshotCapture:
 
             request_handle = result.unpack()[0]
 
-            subscription_id = bus.signal_subscribe(
-                "org.freedesktop.portal.Desktop",
-                "org.freedesktop.portal.Request",
-                "Response",
-                request_handle,
-                None,
-                Gio.DBusSignalFlags.NO_MATCH_RULE,
-                on_response,
-                None
-            )
+            # Signal callbacks are dispatched in the thread default context
+            # that is current when subscribing
+            context.push_thread_default()
+            try:
+                subscription_id = bus.signal_subscribe(
+                    "org.freedesktop.portal.Desktop",
+                    "org.freedesktop.portal.Request",
+                    "Response",
+                    request_handle,
+                    None,
+                    Gio.DBusSignalFlags.NO_MATCH_RULE,
+                    on_response,
+                    None
+                )
+            finally:
+                context.pop_thread_default()
+
+            def on_timeout(*args):
+                if loop.is_running():
+                    loop.quit()
+                return GLib.SOURCE_REMOVE
 
+            timeout = GLib.timeout_source_new_seconds(60)
+            timeout.set_callback(on_timeout)
+            timeout.attach(context)
             try:
-                GLib.timeout_add_seconds(60, lambda: (loop.quit() if loop.is_running() else None, False)[1])
                 loop.run()
             finally:
+                # Do not leave the timeout pending once the portal answered
+                timeout.destroy()
                 bus.signal_unsubscribe(subscription_id)
 
             if screenshot_path and os.path.exists(screenshot_path):
-                self._images = [Image.open(screenshot_path)]
+                # Decode straight from the page cache before the file is removed,
+                # Image.open alone would keep reading from the file lazily
+                with open(screenshot_path, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    image = Image.open(mapped)
+                    image.load()
+                self._images = [image]
                 self._offset_x = 0
                 self._offset_y = 0
 
                 if self._debug:
                     print(f"Portal screenshot loaded: {screenshot_path}")
-                    self._images[0].save("/tmp/ocrScreenshot.png")
+                    self._save_debug_image()
 
                 # Clean up temporary file created by portal
                 try:
@@ -259,26 +316,51 @@ class ScreenshotCapture:
 
     def _capture_clipboard(self):
         """Capture image from clipboard."""
+        from .platform import Gtk, Gdk
+
         try:
             if self._debug:
                 print('get imagedata from clipboard')
             clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             pixbuf = clipboard.wait_for_image()
-            self._images = [pixbuf_to_image(pixbuf)]
-            if self._debug:
-                if self._images[0] is None:
+            if pixbuf is None:
+                if self._debug:
                     print('no image data in clipboard')
+                return False
+            self._images = [pixbuf_to_image(pixbuf)]
         except Exception as e:
             if self._debug:
                 print(e)
             return False
-        return self._images[0] is not None
+        return True
+
+    def _prefetch_file(self, file_path):
+        """Ask the kernel to start reading a file into the page cache.
+
+        The read-ahead runs asynchronously, so decoding or PDF rendering
+        later finds most of the data already in memory.
+
+        Args:
+            file_path: Path to the file
+        """
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            if self._debug:
+                print(f"prefetch {file_path} failed: {e}")
 
-    def _capture_file(self, file_path):
+    def _capture_file(self, file_path, draft_mode=None):
         """Capture image from file (image or PDF).
 
         Args:
             file_path: Path to image or PDF file
+            draft_mode: Image mode to decode JPEG files into, or None
 
         Returns:
             bool: True if file was loaded successfully
@@ -290,26 +372,82 @@ class ScreenshotCapture:
         if not os.path.isfile(file_path):
             return False
 
-        mime = MimeTypes()
-        mime_type = mime.guess_type(file_path)
+        self._prefetch_file(file_path)
 
-        if mime_type[0] != 'application/pdf':
+        # The extension is all the mime type lookup looked at
+        if os.path.splitext(file_path)[1].lower() != '.pdf':
             try:
-                self._images = [Image.open(file_path)]
+                image = Image.open(file_path)
+                if draft_mode and image.format == 'JPEG':
+                    # libjpeg converts while decoding, e.g. only the luma plane for 'L'
+                    image.draft(draft_mode, None)
+                self._images = [image]
             except Exception:
                 return False
         else:
+            from .platform import pypdfium2_available, pdf2image_available, pdfinfo_from_path
+
+            # Each page is rendered when OCR reaches it, instead of decoding
+            # the whole document up front
+            if pypdfium2_available:
+                try:
+                    self._images = self._pdfium_page_loaders(file_path)
+                    return True
+                except Exception as e:
+                    if self._debug:
+                        print(f"pypdfium2 could not open PDF: {e}")
             if not pdf2image_available:
                 return False
             try:
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    images = convert_from_path(file_path, output_folder=temp_dir)
-                    temp_images = []
-                    for i, img in enumerate(images):
-                        image_path = f'{temp_dir}/{i}.jpg'
-                        img.save(image_path, 'JPEG')
-                        temp_images.append(image_path)
-                    self._images = list(map(Image.open, temp_images))
+                page_count = pdfinfo_from_path(file_path)['Pages']
             except Exception:
                 return False
+            self._images = [self._pdf_page_loader(file_path, page) for page in range(1, page_count + 1)]
         return True
+
+    def _pdfium_page_loaders(self, file_path):
+        """Get callables that render the pages of a PDF with pypdfium2.
+
+        The document is parsed once and all pages render from it in process,
+        instead of starting pdftoppm and parsing the file again for every page.
+
+        Args:
+            file_path: Path to the PDF file
+
+        Returns:
+            list: One callable per page, each returning the page as PIL Image
+        """
+        from .platform import pdfium
+
+        pdf = pdfium.PdfDocument(file_path)
+        # PDFium is not thread safe, OCR workers take turns rendering
+        lock = threading.Lock()
+
+        def loader(index):
+            def load_page():
+                with lock:
+                    page = pdf[index]
+                    try:
+                        # The same 200 DPI that pdf2image renders at by default
+                        return page.render(scale=200 / 72).to_pil()
+                    finally:
+                        page.close()
+            return load_page
+        return [loader(index) for index in range(len(pdf))]
+
+    def _pdf_page_loader(self, file_path, page):
+        """Get a callable that renders one PDF page.
+
+        Args:
+            file_path: Path to the PDF file
+            page: Page number, starting at 1
+
+        Returns:
+            callable: Function returning the page as PIL Image
+        """
+        from .platform import convert_from_path
+
+        def load_page():
+            # Pages come back as decoded images, without a round trip through disk
+            return convert_from_path(file_path, first_page=page, last_page=page)[0]
+        return load_page
@@ -0,0 +1,64 @@
+"""Check color names of single color boxes against the original KDTree lookup.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from ocrdesktop_pkg import color
+from ocrdesktop_pkg.platform import numpy_available, webcolors_available
+
+# Names the original per pixel KDTree lookup gave these colors
+BASELINE_NAMES = {
+    (255, 255, 255): 'white',
+    (0, 0, 0): 'black',
+    (255, 0, 0): 'red',
+}
+
+
+@unittest.skipUnless(numpy_available and webcolors_available, 'needs numpy and webcolors')
+class ColorNameTest(unittest.TestCase):
+    """Pure CSS colors must keep their own name."""
+
+    def _color_string(self, rgb):
+        img = Image.new('RGB', (40, 20), rgb)
+        box = {'left': [5], 'top': [5], 'width': [20], 'height': [10]}
+        detector = color.ColorDetector(max_colors=3)
+        detector.enabled = True
+        return detector.get_color_string(box, 0, img)
+
+    def _check_baseline_names(self):
+        for rgb, name in BASELINE_NAMES.items():
+            with self.subTest(rgb=rgb):
+                self.assertEqual(self._color_string(rgb), f'{name}: 100 %')
+
+    def test_baseline_names(self):
+        self._check_baseline_names()
+
+    def test_baseline_names_without_numba(self):
+        original = color._nearest_color_totals
+        color._nearest_color_totals = None
+        try:
+            self._check_baseline_names()
+        finally:
+            color._nearest_color_totals = original
+
+    def test_bucket_named_after_its_most_common_color(self):
+        img = Image.new('RGB', (40, 20), (255, 255, 255))
+        # A few near white pixels that share the bucket of white
+        for x in range(5, 8):
+            img.putpixel((x, 5), (250, 250, 250))
+        box = {'left': [5], 'top': [5], 'width': [20], 'height': [10]}
+        detector = color.ColorDetector(max_colors=3)
+        detector.enabled = True
+        self.assertEqual(detector.get_color_string(box, 0, img), 'white: 100 %')
+
+
+if __name__ == '__main__':
+    unittest.main()
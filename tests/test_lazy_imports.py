@@ -0,0 +1,75 @@
+"""Check that headless runs do not load GTK.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stand-ins for gi and pyatspi, so the check runs without the GTK stack.
+# Every GI namespace is a submodule, importing one adds it to sys.modules.
+STUB_FILES = {
+    'gi/__init__.py': 'def require_version(namespace, version):\n    pass\n',
+    'gi/repository/__init__.py': '',
+    'gi/repository/Gtk.py': '',
+    'gi/repository/Gdk.py': '',
+    'gi/repository/GObject.py': '',
+    'gi/repository/Gio.py': '',
+    'gi/repository/GLib.py': '',
+    'gi/repository/Wnck.py': '',
+    'pyatspi.py': '',
+}
+
+HEADLESS_RUN = textwrap.dedent('''
+    import sys
+    from PIL import Image
+
+    image_path = sys.argv[1]
+    Image.new('RGB', (8, 8)).save(image_path)
+    sys.argv = ['ocrdesktop', '-n', '-o', '-f', image_path]
+
+    from ocrdesktop_pkg import platform
+    from ocrdesktop_pkg.app import OCRDesktopApp
+
+    app = OCRDesktopApp()
+    app._parse_command_line()
+    assert platform.ui_available
+    assert app._screenshot.capture(app._screenshot_mode, app._file_path)
+    app._ocr
+    app._macro
+
+    loaded = sorted(name for name in sys.modules if name.startswith('gi.repository.') or name == 'pyatspi')
+    print(' '.join(loaded))
+''')
+
+
+class HeadlessImportTest(unittest.TestCase):
+    """Loading a file without the GUI must not import GTK, Wnck or pyatspi."""
+
+    def test_file_mode_does_not_load_gtk(self):
+        with tempfile.TemporaryDirectory() as stub_dir:
+            for name, content in STUB_FILES.items():
+                path = os.path.join(stub_dir, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(content)
+
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join((stub_dir, ROOT)),
+                       XDG_SESSION_TYPE='x11', HOME=stub_dir)
+            result = subprocess.run(
+                [sys.executable, '-c', HEADLESS_RUN, os.path.join(stub_dir, 'image.png')],
+                env=env, capture_output=True, text=True
+            )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()